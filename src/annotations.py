@@ -52,8 +52,6 @@ def read_annotations(filepath, verbose=False):
 
 def create_cluster_centers_from_annotations(data, annotations):
 
-    n_features = len(FEATURE_NAMES)
-
     # Load parameters
     with open("params.yaml", "r") as params_file:
         params = yaml.safe_load(params_file)
@@ -64,6 +62,7 @@ def create_cluster_centers_from_annotations(data, annotations):
     overlap = params["featurize"]["overlap"]
     # overlap = window_size - 1
     timestamp_column = params["featurize"]["timestamp_column"]
+    feature_mode = params["featurize"].get("feature_mode", "standard")
 
     # for col in data.columns:
     #     if col not in columns:
@@ -75,6 +74,10 @@ def create_cluster_centers_from_annotations(data, annotations):
 
     scaler = joblib.load(INPUT_SCALER_PATH)
 
+    # The length of the feature vectors depends on the feature mode and the
+    # number of input columns.
+    n_features = scaler.mean_.shape[0]
+
     categories = np.unique(annotations["timeserieslabels"])
     cluster_centers = {}
 
@@ -97,7 +100,11 @@ def create_cluster_centers_from_annotations(data, annotations):
 
             # Featurize the current data.
             features, feature_vector_timestamps = create_feature_vectors(
-                current_data, current_data.index, window_size, overlap
+                current_data,
+                current_data.index,
+                window_size,
+                overlap,
+                mode=feature_mode,
             )
 
             features_list.append(features)
@@ -31,6 +31,7 @@ from plotly.subplots import make_subplots
 from clustermodel import ClusterModel
 from cluster_utils import create_event_log
 from config import API_MODELS_PATH, DATA_PATH_RAW, METRICS_FILE_PATH, LABELS_PATH, PLOTS_PATH, OUTPUT_PATH
+from model_archive import archive_model
 from postprocess import event_log_score
 from udava import Udava
 
@@ -166,6 +167,9 @@ class CreateModel(Resource):
             params["train"]["min_segment_length"] = int(
                 flask.request.form["min_segment_length"]
             )
+            params["train"]["warm_start_from"] = (
+                flask.request.form.get("warm_start_from") or None
+            )
 
             params["featurize"]["convert_timestamp_to_datetime"] = True
             params["train"]["use_predefined_centroids"] = False
@@ -238,6 +242,9 @@ class CreateModel(Resource):
 
         json.dump(models, open(API_MODELS_PATH, "w+"))
 
+        # Archive the model, so that later models can be warm-started from it.
+        archive_model(model_id)
+
         return flask.redirect("create_model_form")
 
 
@@ -0,0 +1,574 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Benchmarks for performance critical parts of the pipeline.
+
+Author:
+    Erik Johannes Husom
+
+Created:
+    2026-10-16
+
+Description:
+    Each benchmark runs on synthetic data and prints the wall-clock time of the
+    alternative implementations, so that they can be compared on the machine
+    where the pipeline is supposed to run.
+
+Example:
+
+    $ python3 src/benchmark.py feature_modes
+
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from sklearn.metrics import euclidean_distances
+from sklearn.preprocessing import StandardScaler
+
+from featurize import create_feature_vectors
+from cluster_utils import (
+    create_event_log_from_segments,
+    filter_segments,
+    find_nearest_cluster_centers,
+    find_segments,
+)
+from train import build_model, compute_cluster_centers
+
+
+def time_function(function, *args, **kwargs):
+    """Return the wall-clock time in seconds of a single function call."""
+
+    start_time = time.perf_counter()
+    function(*args, **kwargs)
+
+    return time.perf_counter() - start_time
+
+
+def benchmark_feature_modes(
+    modes=("standard", "vectorized", "catch22"),
+    n_windows_list=(1000, 10000, 100000),
+    window_size=30,
+    n_columns=1,
+):
+    """Compare the feature modes of create_feature_vectors().
+
+    Args:
+        modes (list): Feature modes to benchmark. The speedup is relative to
+            the first mode.
+        n_windows_list (list): Number of windows to create feature vectors
+            for in each run.
+        window_size (int): Number of time steps in each window.
+        n_columns (int): Number of input columns.
+
+    """
+
+    rng = np.random.default_rng(2020)
+
+    print(f"{'n_windows':>10} {'mode':>10} {'time':>9} {'speedup':>8}")
+
+    for n_windows in n_windows_list:
+        df = pd.DataFrame(rng.normal(size=(n_windows * window_size, n_columns)))
+        baseline = None
+
+        for mode in modes:
+            elapsed = time_function(
+                create_feature_vectors, df, df.index, window_size, 0, mode=mode
+            )
+
+            if baseline is None:
+                baseline = elapsed
+
+            print(
+                f"{n_windows:>10} {mode:>10} {elapsed:>8.3f}s "
+                f"{baseline / elapsed:>7.1f}x"
+            )
+
+
+def benchmark_shards(
+    modes=("standard", "vectorized", "catch22"),
+    n_jobs_list=(1, 2, 4, 8),
+    n_windows=20000,
+    window_size=30,
+):
+    """Compare the number of workers used by create_feature_vectors().
+
+    Args:
+        modes (list): Feature modes to benchmark.
+        n_jobs_list (list): Number of workers to use in each run.
+        n_windows (int): Number of windows to create feature vectors for.
+        window_size (int): Number of time steps in each window.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    df = pd.DataFrame(rng.normal(size=(n_windows * window_size, 1)))
+
+    print(f"{'mode':>10} {'executor':>8} {'n_jobs':>6} {'time':>9} {'speedup':>8}")
+
+    for mode in modes:
+        for executor in ["thread", "process", "auto"]:
+            baseline = None
+
+            for n_jobs in n_jobs_list:
+                elapsed = time_function(
+                    create_feature_vectors,
+                    df,
+                    df.index,
+                    window_size,
+                    0,
+                    mode=mode,
+                    n_jobs=n_jobs,
+                    executor=executor,
+                )
+
+                if baseline is None:
+                    baseline = elapsed
+
+                print(
+                    f"{mode:>10} {executor:>8} {n_jobs:>6} {elapsed:>8.3f}s "
+                    f"{baseline / elapsed:>7.1f}x"
+                )
+
+
+def benchmark_overlap(
+    modes=("standard", "vectorized", "incremental"),
+    window_sizes=(30, 300),
+    n_rows=100000,
+):
+    """Compare the feature modes for windows overlapping by all but one step.
+
+    All windows that fit in the data are used, so the number of feature
+    vectors is about the same as the number of time steps.
+
+    Args:
+        modes (list): Feature modes to benchmark. The speedup is relative to
+            the first mode.
+        window_sizes (list): Number of time steps in each window.
+        n_rows (int): Number of time steps in the data.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    df = pd.DataFrame(rng.normal(size=(n_rows, 1)))
+
+    print(f"{'window_size':>11} {'mode':>11} {'time':>9} {'speedup':>8}")
+
+    for window_size in window_sizes:
+        baseline = None
+
+        for mode in modes:
+            elapsed = time_function(
+                create_feature_vectors,
+                df,
+                df.index,
+                window_size,
+                window_size - 1,
+                mode=mode,
+                n_windows=n_rows - window_size,
+            )
+
+            if baseline is None:
+                baseline = elapsed
+
+            print(
+                f"{window_size:>11} {mode:>11} {elapsed:>8.3f}s "
+                f"{baseline / elapsed:>7.1f}x"
+            )
+
+
+def _compute_cluster_centers_loop(feature_vectors, labels, unique_labels, sample_indices):
+    """Reference implementation of compute_cluster_centers(), with a Python
+    loop over the samples of each cluster."""
+
+    cluster_centers = []
+
+    for c in unique_labels:
+        current_label_feature_vectors = [
+            feature_vectors[i] for i in sample_indices if labels[i] == c
+        ]
+
+        if current_label_feature_vectors:
+            cluster_centers.append(
+                np.average(np.array(current_label_feature_vectors), axis=0)
+            )
+        else:
+            cluster_centers.append(np.zeros(feature_vectors.shape[-1]))
+
+    return np.array(cluster_centers)
+
+
+def benchmark_cluster_centers(n_samples=1000000, n_features=6, n_clusters=8):
+    """Compare the Python loop and the grouped reduction for computing
+    cluster centers of models without cluster_centers_.
+
+    Args:
+        n_samples (int): Number of feature vectors.
+        n_features (int): Number of features.
+        n_clusters (int): Number of clusters.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    feature_vectors = rng.normal(size=(n_samples, n_features))
+    labels = rng.integers(-1, n_clusters, size=n_samples)
+    unique_labels = np.unique(labels)
+    sample_indices = np.arange(n_samples)
+
+    loop = time_function(
+        _compute_cluster_centers_loop,
+        feature_vectors,
+        labels,
+        unique_labels,
+        sample_indices,
+    )
+    vectorized = time_function(
+        compute_cluster_centers, feature_vectors, labels, unique_labels
+    )
+
+    print(f"{'n_samples':>10} {'method':>10} {'time':>9} {'speedup':>8}")
+    print(f"{n_samples:>10} {'loop':>10} {loop:>8.3f}s {1:>7.1f}x")
+    print(
+        f"{n_samples:>10} {'vectorized':>10} {vectorized:>8.3f}s "
+        f"{loop / vectorized:>7.1f}x"
+    )
+
+
+def benchmark_kmeans(
+    learning_methods=("minibatchkmeans", "kmeans_elkan"),
+    n_clusters_list=(8, 32, 64),
+    n_samples=100000,
+    n_features=6,
+    max_iter=100,
+):
+    """Compare the training time and inertia of the k-means learning methods.
+
+    Args:
+        learning_methods (list): Learning methods to benchmark. The speedup is
+            relative to the first method.
+        n_clusters_list (list): Number of clusters in each run.
+        n_samples (int): Number of feature vectors.
+        n_features (int): Number of features.
+        max_iter (int): Maximum iterations.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    feature_vectors = rng.normal(size=(n_samples, n_features))
+
+    print(
+        f"{'n_clusters':>10} {'method':>16} {'time':>9} {'speedup':>8} "
+        f"{'inertia':>12}"
+    )
+
+    for n_clusters in n_clusters_list:
+        baseline = None
+
+        for learning_method in learning_methods:
+            model = build_model(learning_method, n_clusters, max_iter)
+            elapsed = time_function(model.fit, feature_vectors)
+
+            if baseline is None:
+                baseline = elapsed
+
+            print(
+                f"{n_clusters:>10} {learning_method:>16} {elapsed:>8.3f}s "
+                f"{baseline / elapsed:>7.2f}x {model.inertia_:>12.1f}"
+            )
+
+
+def benchmark_dtype(
+    dtypes=("float64", "float32"),
+    n_samples=1000000,
+    n_features=12,
+    n_clusters=8,
+):
+    """Compare memory usage and throughput of the numeric dtypes.
+
+    The steps timed are the ones that process all feature vectors after
+    featurization: scaling, training, predicting labels and computing the
+    distances to the cluster centers. The memory is the size of the output
+    of each step.
+
+    Args:
+        dtypes (list): Dtypes to benchmark. The speedup is relative to the
+            first dtype.
+        n_samples (int): Number of feature vectors.
+        n_features (int): Number of features.
+        n_clusters (int): Number of clusters.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    unscaled = rng.normal(loc=3, scale=2, size=(n_samples, n_features))
+
+    print(f"{'dtype':>8} {'step':>10} {'time':>9} {'speedup':>8} {'memory':>10}")
+
+    baselines = {}
+
+    for dtype in dtypes:
+        feature_vectors = unscaled.astype(dtype)
+        scaler = StandardScaler().fit(feature_vectors)
+        model = build_model("minibatchkmeans", n_clusters, 100)
+        model.set_params(random_state=0)
+
+        steps = {
+            "scale": (lambda: scaler.transform(feature_vectors)),
+            "train": (lambda: model.fit(feature_vectors).cluster_centers_),
+            "predict": (lambda: model.predict(feature_vectors)),
+            "distances": (
+                lambda: euclidean_distances(feature_vectors, model.cluster_centers_)
+            ),
+        }
+
+        for step, function in steps.items():
+            start_time = time.perf_counter()
+            output = function()
+            elapsed = time.perf_counter() - start_time
+
+            baseline = baselines.setdefault(step, elapsed)
+
+            print(
+                f"{dtype:>8} {step:>10} {elapsed:>8.3f}s "
+                f"{baseline / elapsed:>7.2f}x {output.nbytes / 1e6:>8.1f}MB"
+            )
+
+
+def _find_segments_loop(labels):
+    """Reference implementation of find_segments(), with a Python loop over
+    the labels."""
+
+    segments = []
+    start_idx = 0
+
+    for i in range(1, len(labels) + 1):
+        if i == len(labels) or labels[i] != labels[start_idx]:
+            segments.append(
+                [len(segments), labels[start_idx], i - start_idx, start_idx, i - 1]
+            )
+            start_idx = i
+
+    return np.array(segments)
+
+
+def benchmark_find_segments(n_labels=10000000, mean_segment_length=20, n_clusters=8):
+    """Compare the Python loop and the run-length encoding for finding
+    segments of labels.
+
+    Args:
+        n_labels (int): Number of labels.
+        mean_segment_length (int): Mean length of the segments.
+        n_clusters (int): Number of distinct labels.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    segment_lengths = rng.geometric(1 / mean_segment_length, size=n_labels)
+    segment_labels = rng.integers(0, n_clusters, size=n_labels)
+    labels = np.repeat(segment_labels, segment_lengths)[:n_labels]
+
+    loop = time_function(_find_segments_loop, labels)
+    vectorized = time_function(find_segments, labels)
+
+    print(f"{'n_labels':>10} {'method':>10} {'time':>9} {'speedup':>8}")
+    print(f"{n_labels:>10} {'loop':>10} {loop:>8.3f}s {1:>7.1f}x")
+    print(
+        f"{n_labels:>10} {'vectorized':>10} {vectorized:>8.3f}s "
+        f"{loop / vectorized:>7.1f}x"
+    )
+
+
+def _filter_segments_loop(labels, min_segment_length, distances_to_centers):
+    """Reference implementation of filter_segments(), which recomputes and
+    sorts all segments after each filtered segment. The sort is stable, so
+    that ties are resolved in the same order as filter_segments(), and the
+    distances of each segment are copied before they are modified."""
+
+    new_labels = labels.copy()
+
+    segments = find_segments(labels)
+    segments_sorted_on_length = segments[segments[:, 2].argsort(kind="stable")]
+    shortest_segment = np.min(segments[:, 2])
+    number_of_segments = len(segments)
+
+    while shortest_segment < min_segment_length:
+        segment_idx, label, length, start_idx, end_idx = segments_sorted_on_length[0]
+
+        current_distances = distances_to_centers[start_idx : end_idx + 1, :].copy()
+        current_distances[:, label] = np.max(current_distances) + 1
+        second_closest_cluster_centers = current_distances.argmin(axis=1)
+        most_frequent = np.argmax(np.bincount(second_closest_cluster_centers))
+
+        if segment_idx == 0:
+            label_of_previous_segment = segments[segment_idx + 1][1]
+            label_of_next_segment = segments[segment_idx + 1][1]
+        elif segment_idx == len(segments) - 1:
+            label_of_previous_segment = segments[segment_idx - 1][1]
+            label_of_next_segment = segments[segment_idx - 1][1]
+        else:
+            label_of_previous_segment = segments[segment_idx - 1][1]
+            label_of_next_segment = segments[segment_idx + 1][1]
+
+        current_new_labels = np.empty_like(second_closest_cluster_centers)
+
+        if most_frequent == label_of_previous_segment:
+            current_new_labels[:] = label_of_previous_segment
+        elif most_frequent == label_of_next_segment:
+            current_new_labels[:] = label_of_next_segment
+        else:
+            current_new_labels[: length // 2] = label_of_previous_segment
+            current_new_labels[length // 2 :] = label_of_next_segment
+
+        new_labels[start_idx : end_idx + 1] = current_new_labels
+
+        segments = find_segments(new_labels)
+        segments_sorted_on_length = segments[segments[:, 2].argsort(kind="stable")]
+        shortest_segment = np.min(segments[:, 2])
+
+        if len(segments) == number_of_segments:
+            break
+
+        number_of_segments = len(segments)
+
+    return new_labels
+
+
+def benchmark_filter_segments(
+    n_labels=20000, mean_segment_length=4, n_clusters=8, min_segment_length=10
+):
+    """Compare recomputing all segments and the priority queue for filtering
+    out short segments.
+
+    Args:
+        n_labels (int): Number of labels.
+        mean_segment_length (int): Mean length of the segments.
+        n_clusters (int): Number of distinct labels.
+        min_segment_length (int): Minimum length of a segment.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    segment_lengths = rng.geometric(1 / mean_segment_length, size=n_labels)
+    segment_labels = rng.integers(0, n_clusters, size=n_labels)
+    labels = np.repeat(segment_labels, segment_lengths)[:n_labels]
+    distances_to_centers = rng.random((n_labels, n_clusters))
+
+    loop = time_function(
+        _filter_segments_loop, labels, min_segment_length, distances_to_centers
+    )
+    queue = time_function(
+        filter_segments, labels, min_segment_length, distances_to_centers
+    )
+
+    print(f"{'n_labels':>10} {'method':>10} {'time':>9} {'speedup':>8}")
+    print(f"{n_labels:>10} {'loop':>10} {loop:>8.3f}s {1:>7.1f}x")
+    print(f"{n_labels:>10} {'queue':>10} {queue:>8.3f}s {loop / queue:>7.1f}x")
+
+
+def benchmark_nearest_cluster_centers(n_samples=2000000, n_features=12, n_clusters=8):
+    """Compare predicting labels and computing the full distance matrix with
+    finding the nearest cluster centers one batch at a time.
+
+    Args:
+        n_samples (int): Number of feature vectors.
+        n_features (int): Number of features.
+        n_clusters (int): Number of clusters.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    feature_vectors = rng.normal(size=(n_samples, n_features))
+    model = build_model("minibatchkmeans", n_clusters, max_iter=10)
+    model.fit(feature_vectors[:10000])
+
+    def predict_and_calculate_distances():
+        labels = model.predict(feature_vectors)
+        distances_to_centers = euclidean_distances(
+            feature_vectors, model.cluster_centers_
+        )
+        return labels, distances_to_centers.sum(axis=1)
+
+    full = time_function(predict_and_calculate_distances)
+    blocked = time_function(
+        find_nearest_cluster_centers, feature_vectors, model.cluster_centers_
+    )
+
+    print(f"{'n_samples':>10} {'method':>10} {'time':>9} {'speedup':>8}")
+    print(f"{n_samples:>10} {'full':>10} {full:>8.3f}s {1:>7.1f}x")
+    print(f"{n_samples:>10} {'blocked':>10} {blocked:>8.3f}s {full / blocked:>7.1f}x")
+
+
+def _create_event_log_loop(segments, feature_vector_timestamps):
+    """Reference implementation of create_event_log_from_segments(), with a
+    Python loop over the segments."""
+
+    events = []
+
+    for segment in segments:
+        events.append([feature_vector_timestamps[segment[3]], segment[1], "started"])
+        events.append([feature_vector_timestamps[segment[4]], segment[1], "completed"])
+
+    return pd.DataFrame(events, columns=["timestamp", "label", "status"])
+
+
+def benchmark_event_log(n_labels=10000000, mean_segment_length=20, n_clusters=8):
+    """Compare the Python loop and the columnar construction of event logs.
+
+    Args:
+        n_labels (int): Number of labels.
+        mean_segment_length (int): Mean length of the segments.
+        n_clusters (int): Number of distinct labels.
+
+    """
+
+    rng = np.random.default_rng(2020)
+    segment_lengths = rng.geometric(1 / mean_segment_length, size=n_labels)
+    segment_labels = rng.integers(0, n_clusters, size=n_labels)
+    labels = np.repeat(segment_labels, segment_lengths)[:n_labels]
+    timestamps = pd.date_range("2020-01-01", periods=n_labels, freq="s")
+    segments = find_segments(labels)
+
+    loop = time_function(_create_event_log_loop, segments, timestamps)
+
+    print(f"{'n_labels':>10} {'method':>10} {'time':>9} {'speedup':>8}")
+    print(f"{n_labels:>10} {'loop':>10} {loop:>8.3f}s {1:>7.1f}x")
+
+    for output in ["pandas", "numpy"]:
+        columnar = time_function(
+            create_event_log_from_segments, segments, timestamps, output=output
+        )
+        print(
+            f"{n_labels:>10} {output:>10} {columnar:>8.3f}s {loop / columnar:>7.1f}x"
+        )
+
+
+BENCHMARKS = {
+    "feature_modes": benchmark_feature_modes,
+    "shards": benchmark_shards,
+    "overlap": benchmark_overlap,
+    "cluster_centers": benchmark_cluster_centers,
+    "kmeans": benchmark_kmeans,
+    "dtype": benchmark_dtype,
+    "find_segments": benchmark_find_segments,
+    "filter_segments": benchmark_filter_segments,
+    "nearest_cluster_centers": benchmark_nearest_cluster_centers,
+    "event_log": benchmark_event_log,
+}
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "benchmarks",
+        nargs="*",
+        choices=list(BENCHMARKS.keys()),
+        default=list(BENCHMARKS.keys()),
+        help="which benchmarks to run, default=all",
+    )
+
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        print(f"===== {name} =====")
+        BENCHMARKS[name]()
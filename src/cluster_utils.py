@@ -13,6 +13,9 @@ Description:
     clustering results.
 
 """
+import heapq
+import uuid
+
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
@@ -21,16 +24,15 @@ import yaml
 import plotly.graph_objects as go
 from plotly.subplots import make_subplots
 
-from sklearn.metrics import (
-    calinski_harabasz_score,
-    davies_bouldin_score,
-    euclidean_distances,
-    silhouette_score,
-)
+from sklearn.metrics import euclidean_distances
 
 from config import *
+from model_bundle import load_model_bundle
+from preprocess_utils import load_timestamps
 
-def filter_segments(labels, min_segment_length, distances_to_centers=None):
+def filter_segments(
+    labels, min_segment_length, distances_to_centers=None, closest_cluster_centers=None
+):
     """Filter out segments which are too short.
 
     This function filters out segments which are too short. If the segment is
@@ -39,10 +41,23 @@ def filter_segments(labels, min_segment_length, distances_to_centers=None):
     segment will be split in half, and each half will be "swallowed" by the
     neighboring segments.
 
+    The shortest segment is filtered first, and ties are resolved by
+    filtering the earliest segment first. The segments are kept in a
+    doubly-linked list, and the shortest segment is found with a priority
+    queue, so that only the neighbors of a filtered segment have to be
+    updated.
+
+    The distances to the cluster centers are only used to find the two
+    closest cluster centers of each feature vector, and are not modified.
+
     Args:
         labels (np.array): Array of labels.
         min_segment_length (int): Minimum length of a segment.
         distances_to_centers (np.array): Array of distances to cluster centers.
+        closest_cluster_centers (np.array, optional): The closest and second
+            closest cluster center of each feature vector, as returned by
+            find_closest_cluster_centers(). Computed from distances_to_centers
+            if not given.
 
     Returns:
         np.array: Array of updated labels.
@@ -52,60 +67,77 @@ def filter_segments(labels, min_segment_length, distances_to_centers=None):
     # Array for storing updated labels after short segments are filtered out.
     new_labels = labels.copy()
 
-    segments = find_segments(labels)
-
-    segments_sorted_on_length = segments[segments[:, 2].argsort()]
+    if closest_cluster_centers is None:
+        closest_cluster_centers = find_closest_cluster_centers(distances_to_centers)
 
-    shortest_segment = np.min(segments[:, 2])
-    number_of_segments = len(segments)
+    segments = find_segments(labels)
+    n_segments = len(segments)
+
+    # Doubly-linked list of segments, where -1 marks the ends of the list
+    segment_labels = segments[:, 1].tolist()
+    start_indeces = segments[:, 3].tolist()
+    end_indeces = segments[:, 4].tolist()
+    previous_segments = list(range(-1, n_segments - 1))
+    next_segments = list(range(1, n_segments + 1))
+    removed = [False] * n_segments
+
+    if n_segments > 0:
+        next_segments[-1] = -1
+
+    # Priority queue of (length, start_idx, segment). Entries of segments
+    # that have been removed or changed since are skipped.
+    queue = [
+        (end_idx - start_idx + 1, start_idx, i)
+        for i, (start_idx, end_idx) in enumerate(zip(start_indeces, end_indeces))
+    ]
+    heapq.heapify(queue)
 
     # Filter out the segments which are too short
-    while shortest_segment < min_segment_length:
-
-        current_segment = segments_sorted_on_length[0]
-        length = current_segment[2]
-
-        # If the segment length is long enough, break the loop
+    while queue:
+        length, start_idx, segment = heapq.heappop(queue)
+        end_idx = end_indeces[segment]
+
+        if (
+            removed[segment]
+            or start_indeces[segment] != start_idx
+            or end_idx - start_idx + 1 != length
+        ):
+            continue
+
+        # If the shortest segment is long enough, all segments are
         if length >= min_segment_length:
             break
 
-        # Get the information of current segment
-        segment_idx = current_segment[0]
-        label = current_segment[1]
-        start_idx = current_segment[3]
-        end_idx = current_segment[4]
+        previous_segment = previous_segments[segment]
+        next_segment = next_segments[segment]
 
-        current_distances = distances_to_centers[start_idx : end_idx + 1, :]
+        if previous_segment == -1 and next_segment == -1:
+            break
 
-        # Set the original smallest distance to be above the maximum, in order
-        # to find the second closest cluster center
-        current_distances[:, label] = np.max(current_distances) + 1
+        label = segment_labels[segment]
 
-        # Find the second closest cluster center of the current data points
-        second_closest_cluster_centers = current_distances.argmin(axis=1)
+        # Find the second closest cluster center of the current data points,
+        # i.e. the closest one which is not the label of the segment
+        current_closest = closest_cluster_centers[start_idx : end_idx + 1]
+        second_closest_cluster_centers = np.where(
+            current_closest[:, 0] == label, current_closest[:, 1], current_closest[:, 0]
+        )
 
         # Find the most frequent second closest cluster center in the segment
         counts = np.bincount(second_closest_cluster_centers)
         most_frequent_second_closest_cluster_center = np.argmax(counts)
-        current_new_labels = (
-            np.ones_like(second_closest_cluster_centers)
-            * most_frequent_second_closest_cluster_center
-        )
 
-        # Find the neighboring segment labels
-        if segment_idx == 0:
-            # If it is the first segment, then the label of the previous
-            # segment will be set to equal the one for the next segment
-            label_of_previous_segment = segments[segment_idx + 1][1]
-            label_of_next_segment = segments[segment_idx + 1][1]
-        elif segment_idx == len(segments) - 1:
-            # If it is the last segment, then the label of the next
-            # segment will be set to equal the one for the previous segment
-            label_of_previous_segment = segments[segment_idx - 1][1]
-            label_of_next_segment = segments[segment_idx - 1][1]
+        # Find the neighboring segment labels. The first and last segments
+        # only have one neighbor, whose label is used for both.
+        if previous_segment == -1:
+            label_of_previous_segment = segment_labels[next_segment]
+            label_of_next_segment = segment_labels[next_segment]
+        elif next_segment == -1:
+            label_of_previous_segment = segment_labels[previous_segment]
+            label_of_next_segment = segment_labels[previous_segment]
         else:
-            label_of_previous_segment = segments[segment_idx - 1][1]
-            label_of_next_segment = segments[segment_idx + 1][1]
+            label_of_previous_segment = segment_labels[previous_segment]
+            label_of_next_segment = segment_labels[next_segment]
 
         # If the most frequent second closest cluster center in the segment is
         # different from the previous and next segment, the current segment
@@ -113,26 +145,56 @@ def filter_segments(labels, min_segment_length, distances_to_centers=None):
         # neighboring segments. Otherwise the label is set to either the
         # previous or next segment label.
         if most_frequent_second_closest_cluster_center == label_of_previous_segment:
-            current_new_labels[:] = label_of_previous_segment
+            split = length
         elif most_frequent_second_closest_cluster_center == label_of_next_segment:
-            current_new_labels[:] = label_of_next_segment
+            split = 0
         else:
-            current_new_labels[: length // 2] = label_of_previous_segment
-            current_new_labels[length // 2 :] = label_of_next_segment
+            split = length // 2
 
         # Update with new labels
-        new_labels[start_idx : end_idx + 1] = current_new_labels
-
-        # Recompute segments, since they now have changed
-        segments = find_segments(new_labels)
-        segments_sorted_on_length = segments[segments[:, 2].argsort()]
-        shortest_segment = np.min(segments[:, 2])
-
-        if len(segments) == number_of_segments:
-            print("Could not remove any more segments.")
-            break
-
-        number_of_segments = len(segments)
+        new_labels[start_idx : start_idx + split] = label_of_previous_segment
+        new_labels[start_idx + split : end_idx + 1] = label_of_next_segment
+
+        # Let the neighbors swallow the current segment, and remove it from
+        # the list
+        if previous_segment == -1:
+            start_indeces[next_segment] = start_idx
+        elif next_segment == -1:
+            end_indeces[previous_segment] = end_idx
+        else:
+            end_indeces[previous_segment] = start_idx + split - 1
+            start_indeces[next_segment] = start_idx + split
+
+        removed[segment] = True
+
+        if previous_segment != -1:
+            next_segments[previous_segment] = next_segment
+        if next_segment != -1:
+            previous_segments[next_segment] = previous_segment
+
+        # If the neighbors have the same label, they are now one segment
+        if (
+            previous_segment != -1
+            and next_segment != -1
+            and segment_labels[previous_segment] == segment_labels[next_segment]
+        ):
+            end_indeces[previous_segment] = end_indeces[next_segment]
+            removed[next_segment] = True
+            next_segments[previous_segment] = next_segments[next_segment]
+
+            if next_segments[next_segment] != -1:
+                previous_segments[next_segments[next_segment]] = previous_segment
+
+        for neighbor in (previous_segment, next_segment):
+            if neighbor != -1 and not removed[neighbor]:
+                heapq.heappush(
+                    queue,
+                    (
+                        end_indeces[neighbor] - start_indeces[neighbor] + 1,
+                        start_indeces[neighbor],
+                        neighbor,
+                    ),
+                )
 
     return new_labels
 
@@ -159,6 +221,8 @@ def filter_segments_plot_snapshots(labels, min_segment_length, feature_vector_ti
     # Array for storing updated labels after short segments are filtered out.
     new_labels = labels.copy()
 
+    closest_cluster_centers = find_closest_cluster_centers(distances_to_centers)
+
     segments = find_segments(labels)
 
     segments_sorted_on_length = segments[segments[:, 2].argsort()]
@@ -184,14 +248,12 @@ def filter_segments_plot_snapshots(labels, min_segment_length, feature_vector_ti
         start_idx = current_segment[3]
         end_idx = current_segment[4]
 
-        current_distances = distances_to_centers[start_idx : end_idx + 1, :]
-
-        # Set the original smallest distance to be above the maximum, in order
-        # to find the second closest cluster center
-        current_distances[:, label] = np.max(current_distances) + 1
-
-        # Find the second closest cluster center of the current data points
-        second_closest_cluster_centers = current_distances.argmin(axis=1)
+        # Find the second closest cluster center of the current data points,
+        # i.e. the closest one which is not the label of the segment
+        current_closest = closest_cluster_centers[start_idx : end_idx + 1]
+        second_closest_cluster_centers = np.where(
+            current_closest[:, 0] == label, current_closest[:, 1], current_closest[:, 0]
+        )
 
         # Find the most frequent second closest cluster center in the segment
         counts = np.bincount(second_closest_cluster_centers)
@@ -259,38 +321,95 @@ def filter_segments_plot_snapshots(labels, min_segment_length, feature_vector_ti
 
     return new_labels
 
-def create_event_log_from_segments(segments,
-        feature_vector_timestamps=None):
+def create_event_log_from_segments(
+    segments, feature_vector_timestamps=None, output="pandas"
+):
     """Create an event log from segments.
 
+    Each segment gives a "started" event at the timestamp of its first
+    feature vector, and a "completed" event at the timestamp of its last
+    feature vector.
+
     Args:
         segments (np.array): Array of segments.
+        feature_vector_timestamps (np.array, optional): Timestamps of the
+            feature vectors. Loaded from FEATURE_VECTOR_TIMESTAMPS_PATH if
+            not given.
+        output (str): Format of the event log, either "pandas", "numpy" or
+            "arrow".
 
     Returns:
-        pd.DataFrame: Event log.
+        The event log, as a pd.DataFrame, a dict of np.arrays by column name,
+        or a pyarrow.Table.
 
     """
 
-    events = []
+    columns = _event_log_columns(segments, feature_vector_timestamps)
+
+    return _format_event_log(columns, output)
+
+
+def _event_log_columns(segments, feature_vector_timestamps=None):
+    """Build the columns of an event log from segments.
+
+    Args:
+        segments (np.array): Array of segments.
+        feature_vector_timestamps (np.array, optional): Timestamps of the
+            feature vectors.
+
+    Returns:
+        dict: The timestamp, label and status columns of the event log.
+
+    """
 
     if feature_vector_timestamps is None:
-        feature_vector_timestamps = np.load(FEATURE_VECTOR_TIMESTAMPS_PATH)
+        feature_vector_timestamps = load_timestamps(FEATURE_VECTOR_TIMESTAMPS_PATH)
 
-    for i in range(len(segments)):
+    if isinstance(feature_vector_timestamps, np.ndarray):
+        feature_vector_timestamps = feature_vector_timestamps.reshape(-1)
 
-        current_segment = segments[i, :]
-        label = current_segment[1]
-        start_timestamp = feature_vector_timestamps[current_segment[3]]
-        stop_timestamp = feature_vector_timestamps[current_segment[4]]
+    segments = np.asarray(segments).reshape(-1, 5)
 
-        events.append([start_timestamp, label, "started"])
-        events.append([stop_timestamp, label, "completed"])
+    # The start and end of each segment are interleaved, so that each
+    # "started" event is followed by the "completed" event of the segment.
+    event_indeces = segments[:, 3:5].reshape(-1).astype(np.intp)
+
+    return {
+        "timestamp": feature_vector_timestamps[event_indeces],
+        "label": np.repeat(segments[:, 1], 2),
+        "status": np.tile(
+            np.array(["started", "completed"], dtype=object), len(segments)
+        ),
+    }
 
-    event_log = pd.DataFrame(events, columns=["timestamp", "label", "status"])
 
-    return event_log
+def _format_event_log(columns, output="pandas"):
+    """Convert the columns of an event log to the requested format.
 
-def calculate_model_metrics(model, feature_vectors, labels):
+    Args:
+        columns (dict): The columns of the event log.
+        output (str): Either "pandas", "numpy" or "arrow".
+
+    Returns:
+        The event log, as a pd.DataFrame, a dict of np.arrays by column name,
+        or a pyarrow.Table.
+
+    """
+
+    if output == "pandas":
+        return pd.DataFrame(columns)
+    elif output == "numpy":
+        return {name: np.asarray(column) for name, column in columns.items()}
+    elif output == "arrow":
+        # pyarrow is only needed for this output format
+        import pyarrow as pa
+
+        return pa.table({name: pa.array(column) for name, column in columns.items()})
+    else:
+        raise NotImplementedError(f"Event log output {output} not implemented.")
+
+
+def calculate_model_metrics(model, feature_vectors, labels, sample_size=None):
     """Evaluate the cluster model.
 
     Silhouette score: Bounded between -1 for incorrect clustering and +1 for
@@ -299,10 +418,23 @@ def calculate_model_metrics(model, feature_vectors, labels):
     Davies-Bouldin Index: Zero is the lowest score. Lower scores indicate a
         better partition.
 
+    The silhouette score is quadratic in the number of feature vectors, and is
+    therefore estimated on a stratified sample of the feature vectors, drawn
+    with a fixed seed so that the scores of different models are comparable.
+    The silhouette of each sampled feature vector is computed exactly against
+    all feature vectors, and a 95 % confidence interval of the estimate is
+    reported. The Calinski-Harabasz and Davies-Bouldin indices are computed
+    from per-cluster statistics. All computations are done in batches, so that
+    the memory usage does not depend on the number of feature vectors.
+
     Args:
         model (sklearn.cluster): Cluster model.
         feature_vectors (np.array): Feature vectors.
         labels (np.array): Cluster labels.
+        sample_size (int, optional): Number of feature vectors to estimate
+            the silhouette score on. The sample is split between the clusters
+            in proportion to their size. If None, all feature vectors are
+            used.
 
     Returns:
         dict: Dictionary with the model metrics.
@@ -323,12 +455,20 @@ def calculate_model_metrics(model, feature_vectors, labels):
         print("Only one cluster detected. Skipping evaluation.")
         return metrics
 
-    silhouette = silhouette_score(feature_vectors, labels)
-    chs = calinski_harabasz_score(feature_vectors, labels)
-    dbs = davies_bouldin_score(feature_vectors, labels)
+    _, cluster_indices = np.unique(labels, return_inverse=True)
+    cluster_indices = cluster_indices.reshape(-1)
+    cluster_sizes = np.bincount(cluster_indices)
+
+    silhouette, silhouette_ci, n_samples = _sampled_silhouette_score(
+        feature_vectors, cluster_indices, cluster_sizes, sample_size
+    )
+    chs, dbs = _dispersion_scores(feature_vectors, cluster_indices, cluster_sizes)
 
     metrics = {
         "silhouette_score": silhouette,
+        "silhouette_score_ci_lower": silhouette_ci[0],
+        "silhouette_score_ci_upper": silhouette_ci[1],
+        "silhouette_sample_size": n_samples,
         "calinski_harabasz_score": chs,
         "davies_bouldin_score": dbs,
     }
@@ -336,6 +476,180 @@ def calculate_model_metrics(model, feature_vectors, labels):
     return metrics
 
 
+def _sampled_silhouette_score(
+    feature_vectors, cluster_indices, cluster_sizes, sample_size=None, seed=0
+):
+    """Estimate the silhouette score on a stratified sample.
+
+    Args:
+        feature_vectors (np.array): Feature vectors.
+        cluster_indices (np.array): Cluster index of each feature vector, in
+            the range [0, n_clusters).
+        cluster_sizes (np.array): Number of feature vectors in each cluster.
+        sample_size (int): Number of feature vectors in the sample. If None,
+            all feature vectors are used.
+        seed (int): Seed of the random sample.
+
+    Returns:
+        silhouette (float): Estimated silhouette score.
+        confidence_interval (tuple): 95 % confidence interval of the estimate.
+        sample_size (int): Actual number of feature vectors in the sample.
+
+    """
+
+    n_samples = len(cluster_indices)
+    n_clusters = len(cluster_sizes)
+
+    if sample_size is None or sample_size >= n_samples:
+        strata_sizes = cluster_sizes
+    else:
+        strata_sizes = np.floor(sample_size * cluster_sizes / n_samples)
+        strata_sizes = np.minimum(np.maximum(strata_sizes, 2), cluster_sizes)
+        strata_sizes = strata_sizes.astype(np.int64)
+
+    # Draw the sample of each cluster from the feature vectors of the cluster
+    rng = np.random.default_rng(seed)
+    members = np.split(
+        np.argsort(cluster_indices, kind="stable"), np.cumsum(cluster_sizes)[:-1]
+    )
+    strata = [
+        np.sort(rng.choice(m, size=n, replace=False))
+        for m, n in zip(members, strata_sizes)
+    ]
+    sample = np.concatenate(strata)
+    sample_vectors = np.asarray(feature_vectors[sample])
+
+    # Sum the distances from each sampled feature vector to the feature
+    # vectors of each cluster, in batches of feature vectors.
+    batch_size = max(1, 2**22 // len(sample))
+    distance_sums = np.zeros((len(sample), n_clusters))
+
+    for start in range(0, n_samples, batch_size):
+        batch = np.asarray(feature_vectors[start : start + batch_size])
+        batch_indices = cluster_indices[start : start + batch_size]
+        one_hot = batch_indices[:, None] == np.arange(n_clusters)
+        distance_sums += euclidean_distances(sample_vectors, batch) @ one_hot
+
+    own_cluster = cluster_indices[sample]
+    own_sizes = cluster_sizes[own_cluster]
+    rows = np.arange(len(sample))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        a = distance_sums[rows, own_cluster] / (own_sizes - 1)
+        mean_distances = distance_sums / cluster_sizes
+        mean_distances[rows, own_cluster] = np.inf
+        b = mean_distances.min(axis=1)
+        silhouettes = np.nan_to_num((b - a) / np.maximum(a, b))
+
+    # Feature vectors in singleton clusters have a silhouette of zero
+    silhouettes[own_sizes == 1] = 0
+
+    # Stratified estimate of the mean, with finite population correction
+    weights = cluster_sizes / n_samples
+    strata_silhouettes = np.split(silhouettes, np.cumsum(strata_sizes)[:-1])
+    strata_means = np.array([s.mean() for s in strata_silhouettes])
+    strata_variances = np.array(
+        [s.var(ddof=1) if len(s) > 1 else 0.0 for s in strata_silhouettes]
+    )
+
+    silhouette = float(np.sum(weights * strata_means))
+    variance = np.sum(
+        weights**2
+        * (1 - strata_sizes / cluster_sizes)
+        * strata_variances
+        / strata_sizes
+    )
+    margin = 1.96 * float(np.sqrt(variance))
+
+    return silhouette, (silhouette - margin, silhouette + margin), len(sample)
+
+
+def _dispersion_scores(feature_vectors, cluster_indices, cluster_sizes):
+    """Compute the Calinski-Harabasz and Davies-Bouldin indices.
+
+    The indices are computed from per-cluster statistics accumulated over
+    batches of feature vectors. The Calinski-Harabasz index only depends on
+    the sums and the sums of squares of each cluster, which are gathered in a
+    single pass. The Davies-Bouldin index depends on the mean euclidean
+    distance to the centroid of each cluster, which is not a function of these
+    sums, so a second pass is made for this distance only, once the centroids
+    are known.
+
+    Args:
+        feature_vectors (np.array): Feature vectors.
+        cluster_indices (np.array): Cluster index of each feature vector, in
+            the range [0, n_clusters).
+        cluster_sizes (np.array): Number of feature vectors in each cluster.
+
+    Returns:
+        calinski_harabasz (float): Calinski-Harabasz index.
+        davies_bouldin (float): Davies-Bouldin index.
+
+    """
+
+    n_samples, n_features = feature_vectors.shape
+    n_clusters = len(cluster_sizes)
+    batch_size = max(1, 2**22 // n_features)
+
+    # The feature vectors are shifted by the first one to limit the loss of
+    # precision of the sums of squares.
+    shift = np.asarray(feature_vectors[0], dtype=np.float64)
+    sums = np.zeros((n_clusters, n_features))
+    squared_sums = np.zeros(n_clusters)
+
+    for start in range(0, n_samples, batch_size):
+        batch = np.asarray(feature_vectors[start : start + batch_size]) - shift
+        batch_indices = cluster_indices[start : start + batch_size]
+        np.add.at(sums, batch_indices, batch)
+        squared_sums += np.bincount(
+            batch_indices, np.einsum("ij,ij->i", batch, batch), minlength=n_clusters
+        )
+
+    shifted_centroids = sums / cluster_sizes[:, None]
+    centroids = shifted_centroids + shift
+
+    # Calinski-Harabasz index
+    mean = sums.sum(axis=0) / n_samples
+    extra_dispersion = np.sum(
+        cluster_sizes * np.sum((shifted_centroids - mean) ** 2, axis=1)
+    )
+    intra_dispersion = np.sum(
+        np.maximum(squared_sums - np.sum(sums * shifted_centroids, axis=1), 0)
+    )
+
+    if intra_dispersion == 0:
+        calinski_harabasz = 1.0
+    else:
+        calinski_harabasz = float(
+            extra_dispersion
+            * (n_samples - n_clusters)
+            / (intra_dispersion * (n_clusters - 1))
+        )
+
+    # Davies-Bouldin index
+    distance_sums = np.zeros(n_clusters)
+
+    for start in range(0, n_samples, batch_size):
+        batch = np.asarray(feature_vectors[start : start + batch_size])
+        batch_indices = cluster_indices[start : start + batch_size]
+        distances = np.sqrt(np.sum((batch - centroids[batch_indices]) ** 2, axis=1))
+        distance_sums += np.bincount(batch_indices, distances, minlength=n_clusters)
+
+    intra_distances = distance_sums / cluster_sizes
+    centroid_distances = euclidean_distances(centroids)
+
+    if np.allclose(intra_distances, 0) or np.allclose(centroid_distances, 0):
+        davies_bouldin = 0.0
+    else:
+        centroid_distances[centroid_distances == 0] = np.inf
+        combined_intra_distances = intra_distances[:, None] + intra_distances
+        davies_bouldin = float(
+            np.mean(np.max(combined_intra_distances / centroid_distances, axis=1))
+        )
+
+    return calinski_harabasz, davies_bouldin
+
+
 def calculate_distances(feature_vectors, model, cluster_centers):
 
     distances_to_centers = euclidean_distances(feature_vectors, cluster_centers)
@@ -344,6 +658,111 @@ def calculate_distances(feature_vectors, model, cluster_centers):
     return distances_to_centers, sum_distance_to_centers
 
 
+def find_nearest_cluster_centers(feature_vectors, cluster_centers, batch_size=None):
+    """Find the nearest and second nearest cluster center of each feature
+    vector, without keeping the full matrix of distances in memory.
+
+    The distances are computed for one batch of feature vectors at a time,
+    and only the two nearest cluster centers and the sum of the distances are
+    kept for each feature vector. For models with their own cluster centers,
+    the index of the nearest cluster center is the label predicted by the
+    model. With a single cluster center, the second nearest cluster center is
+    the same as the nearest one. Without any cluster centers, which happens
+    when for example AffinityPropagation fails to converge, every feature
+    vector gets the label -1, as noise does for DBSCAN.
+
+    Args:
+        feature_vectors (np.array): Feature vectors.
+        cluster_centers (np.array): Cluster centers.
+        batch_size (int, optional): Number of feature vectors in each batch.
+            By default, the batches are sized so that the distances of a
+            batch have at most 2**16 elements, in order to fit in the cache.
+
+    Returns:
+        labels (np.array): Index of the nearest cluster center.
+        distances (np.array): Distance to the nearest cluster center.
+        second_labels (np.array): Index of the second nearest cluster center.
+        sum_distance_to_centers (np.array): Sum of the distances to all
+            cluster centers.
+
+    """
+
+    feature_vectors = np.asarray(feature_vectors)
+    cluster_centers = np.asarray(cluster_centers, dtype=feature_vectors.dtype)
+    n_feature_vectors = len(feature_vectors)
+    n_clusters = len(cluster_centers)
+
+    if n_clusters == 0:
+        return (
+            np.full(n_feature_vectors, -1, dtype=np.intp),
+            np.full(n_feature_vectors, np.inf, dtype=feature_vectors.dtype),
+            np.full(n_feature_vectors, -1, dtype=np.intp),
+            np.zeros(n_feature_vectors, dtype=feature_vectors.dtype),
+        )
+
+    if batch_size is None:
+        batch_size = max(1, 2**16 // n_clusters)
+
+    labels = np.empty(n_feature_vectors, dtype=np.intp)
+    second_labels = np.empty(n_feature_vectors, dtype=np.intp)
+    distances = np.empty(n_feature_vectors, dtype=feature_vectors.dtype)
+    sum_distance_to_centers = np.empty(n_feature_vectors, dtype=feature_vectors.dtype)
+
+    squared_norms_of_centers = np.einsum("ij,ij->i", cluster_centers, cluster_centers)
+
+    for start in range(0, n_feature_vectors, batch_size):
+        batch = feature_vectors[start : start + batch_size]
+
+        # Squared euclidean distances, ||x||^2 - 2 x.c + ||c||^2
+        batch_distances = batch @ cluster_centers.T
+        batch_distances *= -2
+        batch_distances += np.einsum("ij,ij->i", batch, batch)[:, None]
+        batch_distances += squared_norms_of_centers
+        np.maximum(batch_distances, 0, out=batch_distances)
+        np.sqrt(batch_distances, out=batch_distances)
+
+        rows = np.arange(len(batch))
+        batch_labels = batch_distances.argmin(axis=1)
+
+        labels[start : start + batch_size] = batch_labels
+        distances[start : start + batch_size] = batch_distances[rows, batch_labels]
+        sum_distance_to_centers[start : start + batch_size] = batch_distances.sum(axis=1)
+
+        # Exclude the nearest cluster center to find the second nearest one
+        batch_distances[rows, batch_labels] = np.inf
+        second_labels[start : start + batch_size] = batch_distances.argmin(axis=1)
+
+    return labels, distances, second_labels, sum_distance_to_centers
+
+
+def find_closest_cluster_centers(distances_to_centers):
+    """Find the closest and second closest cluster center of each feature
+    vector.
+
+    Args:
+        distances_to_centers (np.array): Array of distances to cluster centers.
+
+    Returns:
+        np.array: Array with one row per feature vector, containing the index
+            of the closest and the second closest cluster center.
+
+    """
+
+    distances_to_centers = np.asarray(distances_to_centers)
+
+    if distances_to_centers.shape[1] < 2:
+        return np.zeros((len(distances_to_centers), 2), dtype=int)
+
+    closest = np.argpartition(distances_to_centers, 1, axis=1)[:, :2]
+
+    # The two smallest distances are not ordered by argpartition
+    order = np.argsort(
+        np.take_along_axis(distances_to_centers, closest, axis=1), axis=1, kind="stable"
+    )
+
+    return np.take_along_axis(closest, order, axis=1)
+
+
 def find_segments(labels):
     """Find segments in array of labels.
 
@@ -382,63 +801,68 @@ def find_segments(labels):
 
     """
 
-    segments = []
-
-    current_label = labels[0]
-    current_length = 1
-    start_idx = 0
-    segment_idx = 0
-
-    # Count the length of each segment
-    for i in range(1, len(labels)):
-        if labels[i] == current_label:
-            current_length += 1
-            if i == len(labels) - 1:
-                end_idx = i
-                segments.append(
-                    [segment_idx, current_label, current_length, start_idx, end_idx]
-                )
-        else:
-            end_idx = i
-            segments.append(
-                [segment_idx, current_label, current_length, start_idx, end_idx]
-            )
-            segment_idx += 1
-            current_label = labels[i]
-            current_length = 1
-            start_idx = i
+    labels = np.asarray(labels)
+
+    # The start index of each segment, except the first, is where the label
+    # changes.
+    change_points = np.flatnonzero(np.diff(labels)) + 1
 
-    return np.array(segments)
+    start_indeces = np.concatenate([[0], change_points])
+    end_indeces = np.concatenate([change_points, [len(labels)]]) - 1
+
+    if len(labels) == 0:
+        start_indeces = end_indeces = change_points
+
+    segments = np.column_stack(
+        [
+            np.arange(len(start_indeces)),
+            labels[start_indeces],
+            end_indeces - start_indeces + 1,
+            start_indeces,
+            end_indeces,
+        ]
+    )
 
+    return segments
 
-def create_event_log(labels, identifier="",
-        feature_vector_timestamps=None):
+
+def create_event_log(
+    labels, identifier="", feature_vector_timestamps=None, output="pandas"
+):
     """Create an event log from labels.
 
     This function creates an event log from an array of labels. The event log
     has the following format:
 
-    timestamp, label, status
+    timestamp, label, status, source, case
 
     Args:
         labels (np.array): Array of labels.
         identifier (str): Case identifier.
+        feature_vector_timestamps (np.array, optional): Timestamps of the
+            feature vectors. Loaded from FEATURE_VECTOR_TIMESTAMPS_PATH if
+            not given.
+        output (str): Format of the event log, either "pandas", "numpy" or
+            "arrow".
 
     Returns:
-        pd.DataFrame: Event log.
+        The event log, as a pd.DataFrame, a dict of np.arrays by column name,
+        or a pyarrow.Table.
 
     """
 
     if identifier == "":
         identifier = str(uuid.uuid4())
 
-    segments = find_segments(labels)
-    event_log = create_event_log_from_segments(segments,
-            feature_vector_timestamps)
-    event_log["source"] = identifier
-    event_log["case"] = ""
+    segments = find_segments(np.asarray(labels).reshape(-1))
+    columns = _event_log_columns(segments, feature_vector_timestamps)
+
+    n_events = len(columns["status"])
+    columns["source"] = np.full(n_events, identifier, dtype=object)
+    columns["case"] = np.full(n_events, "", dtype=object)
+
+    return _format_event_log(columns, output)
 
-    return event_log
 
 def post_process_labels(
         model,
@@ -488,6 +912,7 @@ def plot_labels_over_time(
     filename=None,
     return_fig=False,
     png_only=False,
+    model_bundle_file=MODEL_BUNDLE_PATH,
 ):
     """Plot labels over time.
 
@@ -505,6 +930,8 @@ def plot_labels_over_time(
         show_local_distance (bool): If True, the local distance of each
             data point to its cluster center will be plotted.
         reduce_plot_size (bool): If True, the plot will be reduced in size.
+        model_bundle_file (str): Path to the model bundle containing the
+            cluster centers.
 
     Returns:
         None.
@@ -518,9 +945,7 @@ def plot_labels_over_time(
     overlap = params["featurize"]["overlap"]
     columns = params["featurize"]["columns"]
 
-    cluster_centers = pd.read_csv(
-        OUTPUT_PATH / "cluster_centers.csv", index_col=0
-    ).to_numpy()
+    cluster_centers = load_model_bundle(model_bundle_file)["cluster_centers"]
 
     if type(columns) is str:
         columns = [columns]
@@ -686,6 +1111,7 @@ def plot_labels_over_time_matplotlib(
     reduce_plot_size=False,
     filename=None,
     return_fig=False,
+    model_bundle_file=MODEL_BUNDLE_PATH,
 ):
     """Plot labels over time.
 
@@ -703,6 +1129,8 @@ def plot_labels_over_time_matplotlib(
         show_local_distance (bool): If True, the local distance of each
             data point to its cluster center will be plotted.
         reduce_plot_size (bool): If True, the plot will be reduced in size.
+        model_bundle_file (str): Path to the model bundle containing the
+            cluster centers.
 
     Returns:
         None.
@@ -716,9 +1144,7 @@ def plot_labels_over_time_matplotlib(
     overlap = params["featurize"]["overlap"]
     columns = params["featurize"]["columns"]
 
-    cluster_centers = pd.read_csv(
-        OUTPUT_PATH / "cluster_centers.csv", index_col=0
-    ).to_numpy()
+    cluster_centers = load_model_bundle(model_bundle_file)["cluster_centers"]
 
     if type(columns) is str:
         columns = [columns]
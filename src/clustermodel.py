@@ -16,14 +16,20 @@ import sys
 import joblib
 import numpy as np
 import pandas as pd
-import scipy as sp
 import yaml
 from pandas.api.types import is_numeric_dtype
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 
-from cluster_utils import calculate_distances, plot_labels_over_time_matplotlib, plot_labels_over_time
+from cluster_utils import (
+    calculate_distances,
+    find_closest_cluster_centers,
+    find_nearest_cluster_centers,
+    plot_labels_over_time_matplotlib,
+    plot_labels_over_time,
+)
 from config import *
 from featurize import *
+from model_bundle import load_model_bundle, scale_feature_vectors
 from postprocess import filter_segments
 from preprocess_utils import find_files, move_column
 from train import *
@@ -35,6 +41,7 @@ class ClusterModel:
         params_file=PARAMS_FILE_PATH,
         input_scaler_file=INPUT_SCALER_PATH,
         model_file=MODELS_FILE_PATH,
+        model_bundle_file=MODEL_BUNDLE_PATH,
         verbose=True,
     ):
 
@@ -46,12 +53,14 @@ class ClusterModel:
 
         self.input_scaler_file = input_scaler_file
         self.model_file = model_file
+        self.model_bundle_file = model_bundle_file
         self.verbose = verbose
 
         self.assets_files = [
             self.params_file,
             self.input_scaler_file,
             self.model_file,
+            self.model_bundle_file,
         ]
 
         self._check_assets_existence()
@@ -87,33 +96,46 @@ class ClusterModel:
         window_size = params["featurize"]["window_size"]
         overlap = params["featurize"]["overlap"]
         min_segment_length = params["postprocess"]["min_segment_length"]
+        dtype = params["featurize"].get("dtype", "float64")
 
         featurized_df = featurize(inference=True, inference_df=inference_df)
         feature_vector_timestamps = featurized_df.index
 
-        feature_vectors = featurized_df.to_numpy()
-        input_scaler = joblib.load(INPUT_SCALER_PATH)
-        feature_vectors = input_scaler.transform(feature_vectors)
-        cluster_centers = pd.read_csv(OUTPUT_PATH / "cluster_centers.csv", index_col=0)
+        # The model bundle is parsed once, and shared with the plotting
+        # functions.
+        bundle = load_model_bundle(self.model_bundle_file)
+        feature_vectors = featurized_df.to_numpy(dtype=dtype)
+        feature_vectors = scale_feature_vectors(feature_vectors, bundle)
+        cluster_centers = bundle["cluster_centers"].astype(dtype)
 
         model = joblib.load(MODELS_FILE_PATH)
 
+        # For models with their own cluster centers, the label is the index of
+        # the nearest cluster center, which is found together with the second
+        # nearest one and the sum of distances in a single pass.
         if learning_method == "dbscan":
             labels = self.dbscan_predict(model, feature_vectors)
+            distances_to_centers, sum_distance_to_centers = calculate_distances(
+                feature_vectors, model, cluster_centers
+            )
+            closest_cluster_centers = find_closest_cluster_centers(distances_to_centers)
         else:
-            labels = model.predict(feature_vectors)
-
-        distance_to_centers, sum_distance_to_centers = calculate_distances(
-            feature_vectors, model, cluster_centers
-        )
+            (
+                labels,
+                _,
+                second_labels,
+                sum_distance_to_centers,
+            ) = find_nearest_cluster_centers(feature_vectors, cluster_centers)
+            closest_cluster_centers = np.column_stack((labels, second_labels))
 
         # If the minimum segment length is set to be a non-zero value, we need to
         # filter the segments.
         if min_segment_length > 0:
-            distances_to_centers, sum_distance_to_centers = calculate_distances(
-                feature_vectors, model, cluster_centers
+            labels = filter_segments(
+                labels,
+                min_segment_length,
+                closest_cluster_centers=closest_cluster_centers,
             )
-            labels = filter_segments(labels, min_segment_length, distances_to_centers)
 
         # plt.figure()
         # plt.plot(labels)
@@ -123,7 +145,8 @@ class ClusterModel:
             print("Plotting results...")
             # visualize_clusters(labels, feature_vectors, model)
             fig = plot_labels_over_time(
-                feature_vector_timestamps, labels, feature_vectors, inference_df, model, return_fig=return_fig, png_only=png_only
+                feature_vector_timestamps, labels, feature_vectors, inference_df, model, return_fig=return_fig, png_only=png_only,
+                model_bundle_file=self.model_bundle_file,
             )
             # fig = plot_labels_over_time_matplotlib(
             #     feature_vector_timestamps, labels, feature_vectors, inference_df, model, return_fig=return_fig
@@ -133,23 +156,59 @@ class ClusterModel:
         else:
             return None, feature_vector_timestamps, labels, sum_distance_to_centers
 
-    def dbscan_predict(self, model, feature_vectors, metric=sp.spatial.distance.cosine):
+    def dbscan_predict(self, model, feature_vectors, batch_size=None):
         """Predict labels for cluster models without native method for
         assigning labels to new data points.
 
+        Each feature vector is assigned the label of the first core sample
+        (in the order of model.components_) with a cosine distance smaller
+        than eps, or -1 (noise) if there is none. The distances are computed
+        for batches of feature vectors at a time, so that the distance matrix
+        does not have to be kept in memory.
+
         Inspiration: https://stackoverflow.com/questions/27822752/scikit-learn-predicting-new-points-with-dbscan
 
+        Args:
+            model (DBSCAN): Fitted DBSCAN model.
+            feature_vectors (np.array): Feature vectors to label.
+            batch_size (int, optional): Number of feature vectors in each
+                batch. By default, the batches are sized so that the distance
+                matrix of a batch has at most 2**22 elements.
+
+        Returns:
+            labels (np.array): Cluster labels.
+
         """
         # Labels are noise by default
         labels = np.ones(shape=len(feature_vectors), dtype=int) * -1
 
-        # Iterate through all input vectors
-        for i, f in enumerate(feature_vectors):
-            # Find a core sample closer than eps
-            for j, core_sample in enumerate(model.components_):
-                if metric(f, core_sample) < model.eps:
-                    # Assign label of x_core to f
-                    labels[i] = model.labels_[model.core_sample_indices_[j]]
-                    break
+        core_samples = np.asarray(model.components_, dtype=np.float64)
+        core_labels = model.labels_[model.core_sample_indices_]
+
+        if len(core_samples) == 0:
+            return labels
+
+        if batch_size is None:
+            batch_size = max(1, 2**22 // len(core_samples))
+
+        core_norms = np.sqrt(np.einsum("ij,ij->i", core_samples, core_samples))
+
+        for start in range(0, len(feature_vectors), batch_size):
+            batch = np.asarray(feature_vectors[start : start + batch_size], dtype=np.float64)
+            norms = np.sqrt(np.einsum("ij,ij->i", batch, batch))
+
+            # Cosine distance, computed as in scipy.spatial.distance.cosine,
+            # which clamps the distance to [0, 2]. The clamp turns the NaN of
+            # zero vectors into a distance of 0, so they are within eps.
+            with np.errstate(divide="ignore", invalid="ignore"):
+                distances = 1.0 - (batch @ core_samples.T) / np.outer(norms, core_norms)
+
+            distances = np.nan_to_num(distances, nan=0.0)
+            within_eps = np.clip(distances, 0.0, 2.0) < model.eps
+
+            # Assign the label of the first core sample within eps
+            has_core = within_eps.any(axis=1)
+            first_core = within_eps.argmax(axis=1)
+            labels[start : start + batch_size][has_core] = core_labels[first_core[has_core]]
 
         return labels
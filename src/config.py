@@ -41,12 +41,18 @@ DATA_PATH = ASSETS_PATH / "data"
 DATA_PATH_RAW = DATA_PATH / "raw"
 """Path to raw data."""
 
+RAW_DATA_CACHE_PATH = DATA_PATH / "cache"
+"""Path to cache of parsed raw data."""
+
 DATA_FEATURIZED_PATH = DATA_PATH / "featurized"
 """Path to data that is has added features."""
 
 FEATURE_VECTORS_PATH = DATA_FEATURIZED_PATH / "featurized.npy"
 """Path to feature vectors of data set."""
 
+UNSCALED_FEATURE_VECTORS_PATH = DATA_FEATURIZED_PATH / "unscaled.tmp"
+"""Path to intermediate file with feature vectors before scaling."""
+
 DATA_SCALED_PATH = DATA_PATH / "scaled"
 """Path to scaled data."""
 
@@ -59,6 +65,12 @@ MODELS_PATH = ASSETS_PATH / "models"
 MODELS_FILE_PATH = MODELS_PATH / "model.pkl"
 """Path to model file."""
 
+MODEL_BUNDLE_PATH = MODELS_PATH / "model_bundle.npz"
+"""Path to binary bundle with cluster centers, scaler parameters and labels."""
+
+MODEL_ARCHIVE_PATH = ASSETS_PATH / "model_archive"
+"""Path to archived models, used for warm-start retraining."""
+
 API_MODELS_PATH = ASSETS_PATH / "models_api.json"
 
 METRICS_PATH = ASSETS_PATH / "metrics"
@@ -76,8 +88,11 @@ PREDEFINED_CENTROIDS_PATH = OUTPUT_PATH / "predefined_centroids.json"
 LABELS_PATH = OUTPUT_PATH / "labels.csv"
 """Path to file containing cluster labels."""
 
+N_CLUSTERS_SWEEP_PATH = OUTPUT_PATH / "n_clusters_sweep.json"
+"""Path to file containing scores of the candidates of an n_clusters sweep."""
+
 CLUSTER_CENTERS_PATH = OUTPUT_PATH / "cluster_centers.csv"
-"""Path to file containing the cluster centers/centroids of the model."""
+"""Path to optional csv-export of the cluster centers/centroids of the model."""
 
 FEATURE_VECTOR_TIMESTAMPS_PATH = OUTPUT_PATH / "feature_vector_timestamps.npy"
 """Path to file containing the timestamps of the feature vectors."""
@@ -107,6 +122,35 @@ OUTPUT_SCALER_PATH = SCALER_PATH / "output_scaler.z"
 FEATURE_NAMES = ["mean", "median", "std", "minmax", "frequency", "gradient"]
 # FEATURE_NAMES = ["mean", "median", "std", "frequency", "gradient"]
 
+# Names of the features in the catch22 feature mode, in the order returned by
+# pycatch22.catch22_all(catch24=True).
+CATCH24_FEATURE_NAMES = [
+    "DN_HistogramMode_5",
+    "DN_HistogramMode_10",
+    "CO_f1ecac",
+    "CO_FirstMin_ac",
+    "CO_HistogramAMI_even_2_5",
+    "CO_trev_1_num",
+    "MD_hrv_classic_pnn40",
+    "SB_BinaryStats_mean_longstretch1",
+    "SB_TransitionMatrix_3ac_sumdiagcov",
+    "PD_PeriodicityWang_th0_01",
+    "CO_Embed2_Dist_tau_d_expfit_meandiff",
+    "IN_AutoMutualInfoStats_40_gaussian_fmmi",
+    "FC_LocalSimple_mean1_tauresrat",
+    "DN_OutlierInclude_p_001_mdrmd",
+    "DN_OutlierInclude_n_001_mdrmd",
+    "SP_Summaries_welch_rect_area_5_1",
+    "SB_BinaryStats_diff_longstretch0",
+    "SB_MotifThree_quantile_hh",
+    "SC_FluctAnal_2_rsrangefit_50_1_logi_prop_r1",
+    "SC_FluctAnal_2_dfa_50_1_2_logi_prop_r1",
+    "SP_Summaries_welch_rect_centroid",
+    "FC_LocalSimple_mean3_stderr",
+    "DN_Mean",
+    "DN_Spread_Std",
+]
+
 COLORS = [
     "red",
     "green",
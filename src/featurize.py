@@ -14,9 +14,15 @@ Description:
     The summary statistics are then saved to file.
 
 """
+import functools
+import heapq
 import json
 import os
+import pickle
 import sys
+import tempfile
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import joblib
 import numpy as np
@@ -24,11 +30,19 @@ import pandas as pd
 import pycatch22
 # import tsfresh
 import yaml
+from numpy.lib.stride_tricks import sliding_window_view
 from pandas.api.types import is_numeric_dtype
+from scipy.ndimage import maximum_filter1d, minimum_filter1d
 from sklearn.preprocessing import MinMaxScaler, StandardScaler
 
 from config import *
-from preprocess_utils import find_files, move_column
+from model_archive import load_archived_model
+from preprocess_utils import (
+    find_files,
+    move_column,
+    read_csv_cached,
+    timestamps_to_array,
+)
 
 
 def featurize(dir_path="", inference=False, inference_df=None):
@@ -65,6 +79,14 @@ def featurize(dir_path="", inference=False, inference_df=None):
     overlap = params["featurize"]["overlap"]
     timestamp_column = params["featurize"]["timestamp_column"]
     convert_timestamp_to_datetime = params["featurize"]["convert_timestamp_to_datetime"]
+    chunk_size = params["featurize"].get("chunk_size", None)
+    n_jobs = params["featurize"].get("n_jobs", 1)
+    shard_n_jobs = params["featurize"].get("shard_n_jobs", 1)
+    shard_executor = params["featurize"].get("shard_executor", "auto")
+    feature_mode = params["featurize"].get("feature_mode", "standard")
+    cache_raw_data = params["featurize"].get("cache_raw_data", False)
+    dtype = np.dtype(params["featurize"].get("dtype", "float64"))
+    warm_start_from = params.get("train", {}).get("warm_start_from", None)
 
     # If the timestamp column does not have a name, we use the default name
     # given to unnamed columns by Pandas.
@@ -78,7 +100,14 @@ def featurize(dir_path="", inference=False, inference_df=None):
 
     if inference:
         featurized_df = _featurize(
-            inference_df, columns, window_size, overlap, timestamp_column
+            inference_df,
+            columns,
+            window_size,
+            overlap,
+            timestamp_column,
+            feature_mode,
+            shard_n_jobs,
+            shard_executor,
         )
 
         return featurized_df
@@ -86,45 +115,92 @@ def featurize(dir_path="", inference=False, inference_df=None):
     else:
         filepaths = find_files(dir_path, file_extension=".csv")
 
-        dfs = []
-        featurized_dfs = []
-
         OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
         DATA_FEATURIZED_PATH.mkdir(parents=True, exist_ok=True)
         SCALER_PATH.mkdir(parents=True, exist_ok=True)
         ANNOTATIONS_PATH.mkdir(parents=True, exist_ok=True)
 
-        for filepath in filepaths:
-
-            # Read csv. If no timestamp column name is given in the parameters,
-            # the timestamp column will be assumed to be the first one.
-            if timestamp_column == None:
-                df = pd.read_csv(filepath, index_col=0)
-            else:
-                df = pd.read_csv(filepath)
-                df = df.set_index(timestamp_column)
+        # The scaler is fitted incrementally while the feature vectors are
+        # written unscaled to an intermediate file, so that neither the
+        # original data nor all the feature vectors have to be kept in memory.
+        # When warm-starting from an archived model, its scaler is updated
+        # with the feature vectors newer than those it was fitted on.
+        if warm_start_from:
+            _, scaler, last_timestamp = load_archived_model(warm_start_from)
+        else:
+            scaler = StandardScaler()
+            last_timestamp = None
+
+        fp_timestamps = []
+        n_feature_vectors = 0
+        n_features = 0
+
+        # The original data is appended to file as it is read, so that it does
+        # not have to be kept in memory.
+        write_header = True
+
+        featurize_params = dict(
+            columns=columns,
+            window_size=window_size,
+            overlap=overlap,
+            timestamp_column=timestamp_column,
+            convert_timestamp_to_datetime=convert_timestamp_to_datetime,
+            chunk_size=chunk_size,
+            cache_raw_data=cache_raw_data,
+            feature_mode=feature_mode,
+            shard_n_jobs=shard_n_jobs,
+            shard_executor=shard_executor,
+        )
 
-            # This needs to be set as a configuration parameter to avoid having
-            # indeces being interpreted as UNIX timestamps.
-            if convert_timestamp_to_datetime:
-                # Attempt to convert timestamps to datetime
-                try:
-                    df.index = pd.to_datetime(df.index)
-                    # Convert to UNIX time
-                    # df.index = df.index.astype(np.int64) // 1e-9
-                except:
-                    pass
-
-            featurized_df = _featurize(
-                df, columns, window_size, overlap, timestamp_column
+        # The files are featurized independently of each other, either in
+        # worker processes or one by one. The results are consumed in the
+        # sorted order of the files either way, so the output is the same.
+        if n_jobs > 1:
+            spilled_files = _map_in_order(
+                functools.partial(
+                    _featurize_file_in_worker,
+                    spill_dir=DATA_FEATURIZED_PATH,
+                    **featurize_params,
+                ),
+                filepaths,
+                n_jobs,
             )
+            featurized_files = (
+                _read_spilled_chunks(spilled_file) for spilled_file in spilled_files
+            )
+        else:
+            featurized_files = (
+                _featurize_file(filepath, **featurize_params) for filepath in filepaths
+            )
+
+        with open(UNSCALED_FEATURE_VECTORS_PATH, "wb") as unscaled_file:
+            for featurized_chunks in featurized_files:
+                for df, featurized_df in featurized_chunks:
+                    df.to_csv(
+                        ORIGINAL_TIME_SERIES_PATH,
+                        mode="w" if write_header else "a",
+                        header=write_header,
+                    )
+                    write_header = False
+
+                    if len(featurized_df) == 0:
+                        continue
 
-            dfs.append(df)
-            featurized_dfs.append(featurized_df)
+                    feature_vectors = featurized_df.to_numpy(dtype=dtype)
 
-        combined_df = pd.concat(dfs)
-        combined_featurized_df = pd.concat(featurized_dfs)
-        fp_timestamps = combined_featurized_df.index
+                    if last_timestamp is None:
+                        scaler.partial_fit(feature_vectors)
+                    else:
+                        new = timestamps_to_array(featurized_df.index) > last_timestamp
+
+                        if new.any():
+                            scaler.partial_fit(feature_vectors[new])
+
+                    unscaled_file.write(feature_vectors.tobytes())
+
+                    fp_timestamps.append(np.asarray(featurized_df.index))
+                    n_feature_vectors += feature_vectors.shape[0]
+                    n_features = feature_vectors.shape[1]
 
         # FIXME: A problem arises when the input consists of multiple files
         # with no timestamps, i. e. the indeces are overlapping.
@@ -133,21 +209,360 @@ def featurize(dir_path="", inference=False, inference_df=None):
         # combined_featurized_df.reset_index(drop=True, inplace=True)
         # combined_featurized_df.index *= window_size
 
-        OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
-
         # Save the timestamps for each feature_vector, in order to use it for
-        # plotting later.
-        np.save(FEATURE_VECTOR_TIMESTAMPS_PATH, fp_timestamps)
+        # plotting later. They are saved as a plain array rather than an
+        # array of objects, so that they can be memory-mapped.
+        np.save(
+            FEATURE_VECTOR_TIMESTAMPS_PATH,
+            timestamps_to_array(np.concatenate(fp_timestamps)),
+        )
 
-        scaler = StandardScaler()
-        scaled = scaler.fit_transform(combined_featurized_df.to_numpy())
         joblib.dump(scaler, INPUT_SCALER_PATH)
 
-        combined_df.to_csv(ORIGINAL_TIME_SERIES_PATH)
-        np.save(FEATURE_VECTORS_PATH, scaled)
+        # Scale the feature vectors in a second pass over the memory-mapped
+        # intermediate file, writing directly to the memory-mapped output.
+        unscaled = np.memmap(
+            UNSCALED_FEATURE_VECTORS_PATH,
+            dtype=dtype,
+            mode="r",
+            shape=(n_feature_vectors, n_features),
+        )
+        scaled = np.lib.format.open_memmap(
+            FEATURE_VECTORS_PATH,
+            mode="w+",
+            dtype=dtype,
+            shape=(n_feature_vectors, n_features),
+        )
+
+        batch_size = max(1, 2**22 // n_features)
+
+        for start in range(0, n_feature_vectors, batch_size):
+            stop = min(start + batch_size, n_feature_vectors)
+            scaled[start:stop] = scaler.transform(unscaled[start:stop])
+
+        scaled.flush()
+        del unscaled, scaled
+        os.remove(UNSCALED_FEATURE_VECTORS_PATH)
+
+
+def _featurize_file(
+    filepath,
+    columns,
+    window_size,
+    overlap,
+    timestamp_column,
+    convert_timestamp_to_datetime,
+    chunk_size=None,
+    cache_raw_data=False,
+    feature_mode="standard",
+    shard_n_jobs=1,
+    shard_executor="auto",
+):
+    """Read and featurize a single csv file.
+
+    Args:
+        filepath (str): Path to csv file.
+        columns (list): Which features/columns to create features from.
+        window_size (int): Size of window/subsequences.
+        overlap (int): Overlap between windows.
+        timestamp_column (str): Name of timestamp column.
+        convert_timestamp_to_datetime (bool): Whether to convert the
+            timestamps to datetime.
+        chunk_size (int): If given, the file is read in chunks of this
+            number of rows.
+        cache_raw_data (bool): Whether to use the cache of parsed raw data
+            when the whole file is read. See read_csv_cached().
+        feature_mode (str): Which features to create. See
+            create_feature_vectors().
+        shard_n_jobs (int): Number of workers used to create the feature
+            vectors of each file or chunk. See create_feature_vectors().
+        shard_executor (str): Type of workers, "thread", "process" or
+            "auto". See create_feature_vectors().
+
+    Returns:
+        iterable: Pairs of original data and feature vectors, one for the
+            whole file, or one for each chunk if chunk_size is given.
+
+    """
+
+    if chunk_size:
+        return _featurize_in_chunks(
+            filepath,
+            columns,
+            window_size,
+            overlap,
+            timestamp_column,
+            convert_timestamp_to_datetime,
+            chunk_size,
+            feature_mode,
+            shard_n_jobs,
+            shard_executor,
+        )
+
+    if cache_raw_data:
+        df = read_csv_cached(
+            filepath,
+            read_raw_data,
+            RAW_DATA_CACHE_PATH,
+            timestamp_column=timestamp_column,
+            convert_timestamp_to_datetime=convert_timestamp_to_datetime,
+        )
+    else:
+        df = read_raw_data(filepath, timestamp_column, convert_timestamp_to_datetime)
+
+    featurized_df = _featurize(
+        df,
+        columns,
+        window_size,
+        overlap,
+        timestamp_column,
+        feature_mode,
+        shard_n_jobs,
+        shard_executor,
+    )
+
+    return [(df, featurized_df)]
+
+
+def _featurize_file_in_worker(filepath, spill_dir, **kwargs):
+    """Featurize a csv file in a worker process.
+
+    A generator cannot be sent back from a worker process, so the chunks are
+    pickled one by one to a temporary file as they are created. Only one
+    chunk is therefore held in memory at a time, both in the worker and when
+    the chunks are read back with _read_spilled_chunks().
+
+    Args:
+        filepath (str): Path to csv file.
+        spill_dir (str): Directory to write the temporary file to.
+        **kwargs: Parameters passed on to _featurize_file().
+
+    Returns:
+        str: Path to the temporary file.
+
+    """
+
+    fd, spilled_file = tempfile.mkstemp(suffix=".tmp", dir=spill_dir)
+
+    with os.fdopen(fd, "wb") as f:
+        for chunk in _featurize_file(filepath, **kwargs):
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    return spilled_file
+
+
+def _read_spilled_chunks(spilled_file):
+    """Read the chunks written by _featurize_file_in_worker().
+
+    The temporary file is removed when all chunks have been read.
+
+    Args:
+        spilled_file (str): Path to the temporary file.
+
+    Yields:
+        tuple: Original data and feature vectors of each chunk.
+
+    """
+
+    try:
+        with open(spilled_file, "rb") as f:
+            while True:
+                try:
+                    yield pickle.load(f)
+                except EOFError:
+                    break
+    finally:
+        os.remove(spilled_file)
+
+
+def _map_in_order(function, iterable, n_jobs):
+    """Apply a function to each item using a process pool.
+
+    At most 2 * n_jobs items are processed or waiting to be consumed at any
+    time, so that the results of all items are not held in memory at once.
+
+    Args:
+        function (callable): Function to apply. Must be picklable.
+        iterable (iterable): Items to apply the function to.
+        n_jobs (int): Number of worker processes.
+
+    Yields:
+        The results of the function, in the same order as the items.
+
+    """
+
+    with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+        futures = deque()
 
+        for item in iterable:
+            if len(futures) >= 2 * n_jobs:
+                yield futures.popleft().result()
 
-def _featurize(df, columns, window_size, overlap, timestamp_column):
+            futures.append(executor.submit(function, item))
+
+        while futures:
+            yield futures.popleft().result()
+
+
+def read_raw_data(filepath, timestamp_column, convert_timestamp_to_datetime):
+    """Read a csv file containing raw time series data.
+
+    Args:
+        filepath (str): Path to csv file.
+        timestamp_column (str): Name of timestamp column. If None, the first
+            column is used as timestamps.
+        convert_timestamp_to_datetime (bool): Whether to convert the
+            timestamps to datetime.
+
+    Returns:
+        df (DataFrame): The time series data, indexed by the timestamps.
+
+    """
+
+    # Read csv. If no timestamp column name is given in the parameters,
+    # the timestamp column will be assumed to be the first one.
+    if timestamp_column == None:
+        df = pd.read_csv(filepath, index_col=0)
+    else:
+        df = pd.read_csv(filepath)
+        df = df.set_index(timestamp_column)
+
+    return _convert_timestamps(df, convert_timestamp_to_datetime)
+
+
+def _convert_timestamps(df, convert_timestamp_to_datetime):
+
+    # This needs to be set as a configuration parameter to avoid having
+    # indeces being interpreted as UNIX timestamps.
+    if convert_timestamp_to_datetime:
+        # Attempt to convert timestamps to datetime
+        try:
+            df.index = pd.to_datetime(df.index)
+            # Convert to UNIX time
+            # df.index = df.index.astype(np.int64) // 1e-9
+        except:
+            pass
+
+    return df
+
+
+def _featurize_in_chunks(
+    filepath,
+    columns,
+    window_size,
+    overlap,
+    timestamp_column,
+    convert_timestamp_to_datetime,
+    chunk_size,
+    feature_mode="standard",
+    shard_n_jobs=1,
+    shard_executor="auto",
+):
+    """Featurize a csv file in chunks of rows, to bound memory usage.
+
+    The rows at the end of a chunk which do not fill a complete window are
+    carried over to the next chunk, so that the feature vectors are the same
+    as when featurizing the whole file at once.
+
+    Args:
+        filepath (str): Path to csv file.
+        columns (list): Which features/columns to create features from.
+        window_size (int): Size of window/subsequences.
+        overlap (int): Overlap between windows.
+        timestamp_column (str): Name of timestamp column.
+        convert_timestamp_to_datetime (bool): Whether to convert the
+            timestamps to datetime.
+        chunk_size (int): Number of rows to read at a time.
+        feature_mode (str): Which features to create. See
+            create_feature_vectors().
+        shard_n_jobs (int): Number of workers used to create the feature
+            vectors of each chunk. See create_feature_vectors().
+        shard_executor (str): Type of workers, "thread", "process" or
+            "auto". See create_feature_vectors().
+
+    Yields:
+        df (DataFrame): The rows of the current chunk.
+        featurized_df (DataFrame): Feature vectors of the windows completed
+            by the current chunk.
+
+    """
+
+    step = window_size - overlap
+
+    # create_feature_vectors() creates n_rows_raw // window_size feature
+    # vectors, which with overlapping windows is fewer than the number of
+    # windows that fit in the data. The number of rows is then needed up front.
+    if overlap > 0:
+        n_rows_raw = sum(
+            len(chunk)
+            for chunk in pd.read_csv(filepath, usecols=[0], chunksize=chunk_size)
+        )
+        max_windows = n_rows_raw // window_size
+    else:
+        max_windows = None
+
+    if timestamp_column == None:
+        reader = pd.read_csv(filepath, index_col=0, chunksize=chunk_size)
+    else:
+        reader = pd.read_csv(filepath, chunksize=chunk_size)
+
+    # The timestamp of a window is at index window_size - step // 2 of the
+    # window, which is the row right after the window when step is 1. That
+    # row is then kept in the chunk, and carried over to the next one.
+    rows_per_window = window_size + 1 if step == 1 else window_size
+
+    tail = None
+    n_windows_total = 0
+
+    for df in reader:
+        if timestamp_column != None:
+            df = df.set_index(timestamp_column)
+
+        df = _convert_timestamps(df, convert_timestamp_to_datetime)
+        df = _select_columns(df, columns)
+
+        if tail is None or len(tail) == 0:
+            buffer = df
+        else:
+            buffer = pd.concat([tail, df])
+
+        if len(buffer) >= rows_per_window:
+            n_windows = (len(buffer) - rows_per_window) // step + 1
+        else:
+            n_windows = 0
+
+        if max_windows is not None:
+            n_windows = max(min(n_windows, max_windows - n_windows_total), 0)
+
+        features, feature_vector_timestamps = create_feature_vectors(
+            buffer,
+            buffer.index,
+            window_size,
+            overlap,
+            mode=feature_mode,
+            n_windows=n_windows,
+            n_jobs=shard_n_jobs,
+            executor=shard_executor,
+        )
+
+        featurized_df = pd.DataFrame(features, index=feature_vector_timestamps)
+
+        yield df, featurized_df
+
+        tail = buffer.iloc[n_windows * step :]
+        n_windows_total += n_windows
+
+
+def _featurize(
+    df,
+    columns,
+    window_size,
+    overlap,
+    timestamp_column,
+    feature_mode="standard",
+    shard_n_jobs=1,
+    shard_executor="auto",
+):
     """Process individual dataframes.
 
     This function creates vectors of summary statistics based on sliding
@@ -161,6 +576,12 @@ def _featurize(df, columns, window_size, overlap, timestamp_column):
         window_size (int): Size of window/subsequences.
         overlap (int): Overlap between windows.
         timestamp_column (str): Name of timestamp column.
+        feature_mode (str): Which features to create. See
+            create_feature_vectors().
+        shard_n_jobs (int): Number of workers used to create the feature
+            vectors. See create_feature_vectors().
+        shard_executor (str): Type of workers, "thread", "process" or
+            "auto". See create_feature_vectors().
 
     Returns:
         df (DataFrame): Dataframe with features created from original
@@ -168,6 +589,35 @@ def _featurize(df, columns, window_size, overlap, timestamp_column):
 
     """
 
+    df = _select_columns(df, columns)
+
+    features, feature_vector_timestamps = create_feature_vectors(
+        df,
+        df.index,
+        window_size,
+        overlap,
+        mode=feature_mode,
+        n_jobs=shard_n_jobs,
+        executor=shard_executor,
+    )
+
+    df = pd.DataFrame(features, index=feature_vector_timestamps)
+
+    return df
+
+
+def _select_columns(df, columns):
+    """Remove the columns that should not be used to create features.
+
+    Args:
+        df (DataFrame): Dataframe to select columns from. Modified in place.
+        columns (list): Which features/columns to create features from.
+
+    Returns:
+        df (DataFrame): Dataframe with only the selected numeric columns.
+
+    """
+
     # If no features are specified, use all columns as features
     if type(columns) is str:
         columns = [columns]
@@ -185,16 +635,19 @@ def _featurize(df, columns, window_size, overlap, timestamp_column):
         elif not is_numeric_dtype(df[col]):
             del df[col]
 
-    features, feature_vector_timestamps = create_feature_vectors(
-        df, df.index, window_size, overlap
-    )
-
-    df = pd.DataFrame(features, index=feature_vector_timestamps)
-
     return df
 
 
-def create_feature_vectors(df, timestamps, window_size, overlap, mode="standard"):
+def create_feature_vectors(
+    df,
+    timestamps,
+    window_size,
+    overlap,
+    mode="standard",
+    n_windows=None,
+    n_jobs=1,
+    executor="auto",
+):
     """Create feature_vectors of time series data.
 
     The feature vector is based on statistical properties.
@@ -211,8 +664,30 @@ def create_feature_vectors(df, timestamps, window_size, overlap, mode="standard"
             following modes are available:
             - standard: Create feature_vectors based on statistical properties
                 of the time series data.
-            - catch22: Create feature_vectors based on the catch22 library.
-
+            - vectorized: Same features as "standard", but computed with
+                batched NumPy reductions over a strided view of all windows
+                instead of looping over each window. Gives identical output.
+            - incremental: Same features as "standard", but the statistics
+                are updated as the window slides instead of being recomputed
+                for each window. Intended for windows with large overlap.
+                Equal to the output of "standard" up to rounding errors.
+            - catch22: Create feature_vectors based on the catch22 library,
+                with the 24 catch24 features computed for each column.
+        n_windows (int): Number of feature_vectors to create. If None, the
+            number of rows in df divided by window_size is used.
+        n_jobs (int): Number of workers. If larger than 1, the windows are
+            split into n_jobs shards of consecutive windows, which are
+            processed in parallel.
+        executor (str): Type of workers to use when n_jobs is larger than 1:
+            - thread: A thread pool. Only gives parallelism for the
+                vectorized mode, where most of the work is done in NumPy
+                code that releases the GIL. The standard and incremental
+                modes loop over the windows in Python, and pycatch22 never
+                releases the GIL.
+            - process: A process pool. The shards are copied to the worker
+                processes.
+            - auto: A thread pool for the vectorized mode, and a process pool
+                for the other modes.
 
     Returns:
         feature_vectors (Numpy array): An array of feature_vectors for the time
@@ -224,26 +699,38 @@ def create_feature_vectors(df, timestamps, window_size, overlap, mode="standard"
 
     n_input_columns = df.shape[1]
     n_rows_raw = df.shape[0]
-    n_rows = n_rows_raw // window_size
+    n_rows = n_rows_raw // window_size if n_windows is None else n_windows
     step = window_size - overlap
     feature_vector_timestamps = []
 
+    if n_jobs > 1 and n_rows > 1:
+        return _create_feature_vectors_in_shards(
+            df, timestamps, window_size, overlap, mode, n_rows, n_jobs, executor
+        )
+
     if mode == "catch22":
         n_features = 24
         features = np.zeros((n_rows, n_features, n_input_columns))
 
+        # Each column is stored in a contiguous float64 buffer, so that the
+        # windows can be passed to catch22 without any conversion of the data
+        # frame.
+        values = np.ascontiguousarray(np.asarray(df, dtype=np.float64).T)
+
         # Loop through all observations and calculate features within window
         for i in range(n_rows):
             start = i * step
             stop = start + window_size
 
-            window = np.array(df.iloc[start:stop, :])
-            feature_vector_timestamps.append(timestamps[stop - (step // 2)])
-
             for j in range(n_input_columns):
-                features[i, :, j] = pycatch22.catch22_all(window, catch24=True)[
-                    "values"
-                ]
+                features[i, :, j] = pycatch22.catch22_all(
+                    values[j, start:stop].tolist(), catch24=True
+                )["values"]
+
+        timestamp_indeces = np.arange(n_rows) * step + window_size - (step // 2)
+        feature_vector_timestamps = list(
+            np.asarray(timestamps, dtype=object)[timestamp_indeces]
+        )
 
     # elif mode == "tsfresh":
     #     features = []
@@ -285,32 +772,47 @@ def create_feature_vectors(df, timestamps, window_size, overlap, mode="standard"
     else:
         n_features = 6
 
-        # Initialize descriptive feature matrices
-        mean = np.zeros((n_rows, n_input_columns))
-        median = np.zeros((n_rows, n_input_columns))
-        std = np.zeros((n_rows, n_input_columns))
-        # rms = np.zeros((n_rows, n_input_columns))
-        # var = np.zeros((n_rows, n_input_columns))
-        minmax = np.zeros((n_rows, n_input_columns))
-        frequency = np.zeros((n_rows, n_input_columns))
-        gradient = np.zeros((n_rows, n_input_columns))
-
-        # Loop through all observations and calculate features within window
-        for i in range(n_rows):
-            start = i * step
-            stop = start + window_size
+        if mode in ["vectorized", "incremental"]:
+            if mode == "vectorized":
+                statistics_function = _window_statistics
+            else:
+                statistics_function = _incremental_window_statistics
 
-            window = np.array(df.iloc[start:stop, :])
-            feature_vector_timestamps.append(timestamps[stop - (step // 2)])
+            mean, median, std, minmax, frequency, gradient = statistics_function(
+                np.asarray(df), n_rows, window_size, step
+            )
 
-            mean[i, :] = np.mean(window, axis=0)
-            median[i, :] = np.median(window, axis=0)
-            std[i, :] = np.std(window, axis=0)
-            # rms[i, :] = np.sqrt(np.mean(np.square(window, axis=0)))
-            # var[i, :] = np.var(window, axis=0)
-            minmax[i, :] = np.max((window), axis=0) - np.min((window), axis=0)
-            frequency[i, :] = np.linalg.norm(np.fft.rfft(window, axis=0), axis=0, ord=2)
-            gradient[i, :] = np.mean(np.gradient(window, axis=0))
+            timestamp_indeces = np.arange(n_rows) * step + window_size - (step // 2)
+            feature_vector_timestamps = list(
+                np.asarray(timestamps, dtype=object)[timestamp_indeces]
+            )
+        else:
+            # Initialize descriptive feature matrices
+            mean = np.zeros((n_rows, n_input_columns))
+            median = np.zeros((n_rows, n_input_columns))
+            std = np.zeros((n_rows, n_input_columns))
+            # rms = np.zeros((n_rows, n_input_columns))
+            # var = np.zeros((n_rows, n_input_columns))
+            minmax = np.zeros((n_rows, n_input_columns))
+            frequency = np.zeros((n_rows, n_input_columns))
+            gradient = np.zeros((n_rows, n_input_columns))
+
+            # Loop through all observations and calculate features within window
+            for i in range(n_rows):
+                start = i * step
+                stop = start + window_size
+
+                window = np.array(df.iloc[start:stop, :])
+                feature_vector_timestamps.append(timestamps[stop - (step // 2)])
+
+                mean[i, :] = np.mean(window, axis=0)
+                median[i, :] = np.median(window, axis=0)
+                std[i, :] = np.std(window, axis=0)
+                # rms[i, :] = np.sqrt(np.mean(np.square(window, axis=0)))
+                # var[i, :] = np.var(window, axis=0)
+                minmax[i, :] = np.max((window), axis=0) - np.min((window), axis=0)
+                frequency[i, :] = _window_fft_norm(window, axis=0)
+                gradient[i, :] = np.mean(np.gradient(window, axis=0))
 
         features = np.concatenate(
             (mean, median, std, minmax, frequency, gradient), axis=1
@@ -329,6 +831,532 @@ def create_feature_vectors(df, timestamps, window_size, overlap, mode="standard"
     return features, feature_vector_timestamps
 
 
+def _create_feature_vectors_in_shards(
+    df, timestamps, window_size, overlap, mode, n_rows, n_jobs, executor
+):
+    """Create feature_vectors by processing shards of windows in parallel.
+
+    Each shard covers a range of consecutive windows, and gets the slice of
+    df and timestamps needed by these windows.
+
+    Args:
+        df (DataFrame): The data frame to create feature_vectors from.
+        timestamps (Series): The timestamps corresponding to the time series in
+            df.
+        window_size (int): Number of time steps to include when calculating
+            a feature_vector.
+        overlap (int): How much overlap between windows of the time series
+            data.
+        mode (str): The mode to use when creating feature_vectors.
+        n_rows (int): Number of feature_vectors to create.
+        n_jobs (int): Number of workers.
+        executor (str): Type of workers, "thread", "process" or "auto".
+
+    Returns:
+        feature_vectors (Numpy array): An array of feature_vectors for the time
+            series data.
+        feature_vector_timestamps (Index): The timestamps of the
+            feature_vectors.
+
+    """
+
+    step = window_size - overlap
+
+    if executor == "auto":
+        executor = "thread" if mode == "vectorized" else "process"
+
+    if executor == "thread":
+        executor_class = ThreadPoolExecutor
+    elif executor == "process":
+        executor_class = ProcessPoolExecutor
+    else:
+        raise NotImplementedError(f"Executor {executor} not implemented.")
+
+    shard_bounds = np.linspace(0, n_rows, min(n_jobs, n_rows) + 1, dtype=int)
+
+    dfs = []
+    shard_timestamps = []
+    shard_n_windows = []
+
+    for first_window, last_window in zip(shard_bounds[:-1], shard_bounds[1:]):
+        start = first_window * step
+        # The timestamp of a window might be the one right after the window
+        # itself, so one extra time step is included.
+        stop = (last_window - 1) * step + window_size + 1
+
+        dfs.append(df.iloc[start:stop])
+        shard_timestamps.append(timestamps[start:stop])
+        shard_n_windows.append(last_window - first_window)
+
+    create_shard = functools.partial(
+        _create_feature_vectors_shard,
+        window_size=window_size,
+        overlap=overlap,
+        mode=mode,
+    )
+
+    with executor_class(max_workers=n_jobs) as pool:
+        results = list(
+            pool.map(create_shard, dfs, shard_timestamps, shard_n_windows)
+        )
+
+    features = np.concatenate([result[0] for result in results])
+    feature_vector_timestamps = pd.Index(
+        np.concatenate([np.asarray(result[1]) for result in results]),
+        dtype=object,
+        name="Date",
+    )
+
+    return features, feature_vector_timestamps
+
+
+def _create_feature_vectors_shard(
+    df, timestamps, n_windows, window_size, overlap, mode
+):
+    """Create the feature_vectors of a single shard of windows."""
+
+    return create_feature_vectors(
+        df, timestamps, window_size, overlap, mode=mode, n_windows=n_windows
+    )
+
+
+def _window_statistics(values, n_rows, window_size, step, batch_size=None):
+    """Compute the standard features for all windows of an array at once.
+
+    The windows are read through a strided view of `values`, so no window is
+    copied on its own. To bound the size of the temporary arrays created by
+    the reductions, the windows are processed in batches.
+
+    Args:
+        values (Numpy array): Array of size N*C, where N is the number of time
+            steps and C is the number of input columns.
+        n_rows (int): Number of windows to compute features for.
+        window_size (int): Number of time steps in each window.
+        step (int): Number of time steps between the start of two windows.
+        batch_size (int): Number of windows to process at a time. If None, it
+            is chosen so that each batch covers about 2**22 values.
+
+    Returns:
+        tuple: Arrays of size n_rows*C for mean, median, std, minmax,
+            frequency and gradient, in the same order as FEATURE_NAMES.
+
+    """
+
+    n_input_columns = values.shape[1]
+    statistics = tuple(np.zeros((n_rows, n_input_columns)) for _ in range(6))
+
+    if n_rows == 0:
+        return statistics
+
+    if batch_size is None:
+        batch_size = max(1, 2**22 // (window_size * n_input_columns))
+
+    # Shape (n_windows, n_input_columns, window_size), transposed to put the
+    # window axis first, matching the layout of a single window in the
+    # standard mode.
+    windows = sliding_window_view(values, window_size, axis=0)[::step][:n_rows]
+    windows = windows.transpose(0, 2, 1)
+
+    mean, median, std, minmax, frequency, gradient = statistics
+
+    # The gradient feature is averaged over all values in a window, and NumPy
+    # sums these in memory order. Data frames with several columns are
+    # usually stored column by column, so the gradients are summed in the same
+    # order as in the standard mode to give identical results.
+    column_major = values.strides[0] < values.strides[1]
+
+    for start in range(0, n_rows, batch_size):
+        stop = min(start + batch_size, n_rows)
+        batch = windows[start:stop]
+
+        mean[start:stop] = np.mean(batch, axis=1)
+        median[start:stop] = np.median(batch, axis=1)
+        std[start:stop] = np.std(batch, axis=1)
+        minmax[start:stop] = np.max(batch, axis=1) - np.min(batch, axis=1)
+        frequency[start:stop] = _window_fft_norm(batch, axis=1)
+        window_gradient = np.gradient(batch, axis=1)
+        if column_major:
+            window_gradient = np.ascontiguousarray(window_gradient.transpose(0, 2, 1))
+        gradient[start:stop] = np.mean(window_gradient, axis=(1, 2))[:, np.newaxis]
+
+    return statistics
+
+
+def _incremental_window_statistics(values, n_rows, window_size, step):
+    """Compute the standard features by sliding a window across the data.
+
+    Instead of recomputing the statistics of each window from scratch, which
+    costs O(N*W) for N time steps and windows of size W when the windows
+    overlap, the statistics are updated as the window slides:
+
+    - mean and std: Running sums of the values and the squared values,
+      computed by _block_running_sums(). The cumulative sums restart at every
+      block of W time steps, so that the loss of precision does not grow with
+      the length of the series.
+    - minmax: Minimum and maximum filters, which keep a monotonic queue of
+      candidates for the extremes of the current window.
+    - median: Two heaps holding the lower and upper half of the current
+      window, updated in O(log W) by _sliding_median().
+    - gradient: The mean of np.gradient() over a window only depends on the
+      first two and last two values of the window.
+    - frequency: Computed from the running sums with fft_norm(), without
+      computing any FFT.
+
+    Windows containing NaN are recomputed with _window_statistics(), so that
+    they get the same features as in the standard mode.
+
+    Args:
+        values (Numpy array): Array of size N*C, where N is the number of time
+            steps and C is the number of input columns.
+        n_rows (int): Number of windows to compute features for.
+        window_size (int): Number of time steps in each window.
+        step (int): Number of time steps between the start of two windows.
+
+    Returns:
+        tuple: Arrays of size n_rows*C for mean, median, std, minmax,
+            frequency and gradient, in the same order as FEATURE_NAMES.
+
+    """
+
+    n_input_columns = values.shape[1]
+    mean, median, std, minmax, frequency, _ = tuple(
+        np.zeros((n_rows, n_input_columns)) for _ in range(6)
+    )
+
+    if n_rows == 0:
+        return mean, median, std, minmax, frequency, np.zeros_like(mean)
+
+    starts = np.arange(n_rows) * step
+    stops = starts + window_size
+    raw_values = np.asarray(values, dtype=np.float64)[: stops[-1]]
+
+    # NaN would spread through the running sums to all later windows, and
+    # cannot be ordered by the heaps. The NaN are therefore replaced by the
+    # previous valid value (or the next one, at the start of the series), and
+    # the windows containing them are recomputed at the end. The replacement
+    # stays close to the block shift of the running sums, which a constant
+    # like zero would not, and would then ruin the precision of the sums of
+    # the other windows in the same blocks.
+    nan_mask = np.isnan(raw_values)
+    values = pd.DataFrame(raw_values).ffill().bfill().fillna(0.0).to_numpy()
+
+    for j in range(n_input_columns):
+        column = values[:, j]
+
+        # Running sums, centered on a shift close to the values of each window
+        shifts, sums, squared_sums, alternating_sums = _block_running_sums(
+            column, starts, window_size
+        )
+        centered_mean = sums / window_size
+
+        mean[:, j] = shifts + centered_mean
+        std[:, j] = np.sqrt(
+            np.maximum(squared_sums / window_size - centered_mean ** 2, 0)
+        )
+
+        # The sums are shifted back to the original values for the FFT-norm
+        frequency[:, j] = fft_norm(
+            sums + window_size * shifts,
+            squared_sums + 2 * shifts * sums + window_size * shifts ** 2,
+            alternating_sums + (window_size % 2) * shifts,
+            window_size,
+        )
+
+        # Minimum and maximum. The filters are centered, so the window
+        # starting at index i is centered at index i + window_size // 2.
+        centers = starts + window_size // 2
+        minmax[:, j] = (
+            maximum_filter1d(column, window_size)[centers]
+            - minimum_filter1d(column, window_size)[centers]
+        )
+
+        # Median
+        if step >= window_size:
+            windows = sliding_window_view(column, window_size)[starts]
+            median[:, j] = np.median(windows, axis=1)
+        else:
+            median[:, j] = _sliding_median(column, n_rows, window_size, step)
+
+    # The mean of np.gradient() over a window is given by the edge values,
+    # since the central differences of the interior telescope:
+    # (x[1] - x[0]) + (x[-1] - x[-2]) + (x[-1] + x[-2] - x[0] - x[1]) / 2
+    first = values[starts]
+    second = values[starts + 1]
+    second_last = values[stops - 2]
+    last = values[stops - 1]
+    gradient_sum = (second - first) + (last - second_last)
+    gradient_sum += (last + second_last - first - second) / 2
+    gradient = np.repeat(
+        gradient_sum.sum(axis=1, keepdims=True) / (window_size * n_input_columns),
+        n_input_columns,
+        axis=1,
+    )
+
+    statistics = (mean, median, std, minmax, frequency, gradient)
+
+    # Recompute the windows containing NaN in any column, since the gradient
+    # feature is shared by all columns.
+    nan_counts = np.concatenate(([0], np.cumsum(nan_mask.any(axis=1))))
+    windows_with_nan = np.flatnonzero(nan_counts[stops] - nan_counts[starts])
+
+    if len(windows_with_nan) > 0:
+        indeces = starts[windows_with_nan, np.newaxis] + np.arange(window_size)
+        windows = raw_values[indeces].reshape(-1, n_input_columns)
+        recomputed = _window_statistics(
+            windows, len(windows_with_nan), window_size, window_size
+        )
+
+        for statistic, recomputed_statistic in zip(statistics, recomputed):
+            statistic[windows_with_nan] = recomputed_statistic
+
+    return statistics
+
+
+def _block_running_sums(column, starts, window_size):
+    """Compute sums over windows of a column from cumulative sums.
+
+    A cumulative sum over the whole column grows with the length of the
+    series, and the sum of a window is then the difference of two large
+    numbers. Instead, the column is split into blocks of window_size time
+    steps, and the cumulative sums restart at every block, with the values of
+    each block centered on the first value of the block. Each window covers
+    the end of one block and the start of the next, and its sums are centered
+    on the shift of the first of these blocks.
+
+    Args:
+        column (Numpy array): Values of a single input column.
+        starts (Numpy array): Start index of each window.
+        window_size (int): Number of time steps in each window.
+
+    Returns:
+        shifts (Numpy array): The value the sums of each window are centered
+            on.
+        sums (Numpy array): Sum of x - shift over each window.
+        squared_sums (Numpy array): Sum of (x - shift)**2 over each window.
+        alternating_sums (Numpy array): Sum of x - shift over each window,
+            with alternating signs starting with a positive sign.
+
+    """
+
+    n_blocks = len(column) // window_size + 1
+    blocks = np.zeros(n_blocks * window_size)
+    blocks[: len(column)] = column
+    blocks = blocks.reshape(n_blocks, window_size)
+
+    block_shifts = blocks[:, 0].copy()
+    centered = blocks - block_shifts[:, np.newaxis]
+    signs = np.where(np.arange(blocks.size) % 2 == 0, 1.0, -1.0)
+    signs = signs.reshape(n_blocks, window_size)
+
+    def cumulative_sums(block_values):
+        return np.concatenate(
+            (np.zeros((n_blocks, 1)), np.cumsum(block_values, axis=1)), axis=1
+        )
+
+    # The window starting at index s covers the time steps from the offset
+    # s % window_size in block s // window_size, up to the same offset in the
+    # next block.
+    first_blocks, offsets = np.divmod(starts, window_size)
+    next_blocks = first_blocks + 1
+
+    def window_sums(block_values):
+        block_sums = cumulative_sums(block_values)
+        first_part = block_sums[first_blocks, -1] - block_sums[first_blocks, offsets]
+        second_part = block_sums[next_blocks, offsets]
+        return first_part, second_part
+
+    shifts = block_shifts[first_blocks]
+    shift_differences = block_shifts[next_blocks] - shifts
+
+    first_part, second_part = window_sums(centered)
+    sums = first_part + second_part + offsets * shift_differences
+
+    first_squared_part, second_squared_part = window_sums(centered ** 2)
+    squared_sums = (
+        first_squared_part
+        + second_squared_part
+        + 2 * shift_differences * second_part
+        + offsets * shift_differences ** 2
+    )
+
+    # Alternating sums with the sign of the global index. The sum of the
+    # signs from index a up to b is ((-1)**a - (-1)**b) / 2. The sign is
+    # flipped for windows starting at an odd index.
+    first_alternating_part, second_alternating_part = window_sums(signs * centered)
+    second_part_start_signs = 1 - 2 * (next_blocks * window_size % 2)
+    stop_signs = 1 - 2 * ((starts + window_size) % 2)
+    start_signs = 1 - 2 * (starts % 2)
+    alternating_sums = start_signs * (
+        first_alternating_part
+        + second_alternating_part
+        + shift_differences * (second_part_start_signs - stop_signs) / 2
+    )
+
+    return shifts, sums, squared_sums, alternating_sums
+
+
+def _sliding_median(column, n_rows, window_size, step):
+    """Compute the median of overlapping windows of a column.
+
+    The lower half of the current window is kept in a max-heap, and the upper
+    half in a min-heap, so that the median is given by the tops of the heaps.
+    The values leaving the window are removed lazily, when they reach the top
+    of a heap. Each value entering or leaving the window costs O(log W).
+
+    Args:
+        column (Numpy array): Values of a single input column, without NaN.
+        n_rows (int): Number of windows.
+        window_size (int): Number of time steps in each window.
+        step (int): Number of time steps between the start of two windows.
+            Must be smaller than window_size.
+
+    Returns:
+        Numpy array: The median of each window.
+
+    """
+
+    medians = np.zeros(n_rows)
+    values = column.tolist()
+
+    # The lower half is stored with negated values, since heapq is a min-heap
+    lower = []
+    upper = []
+    n_lower = 0
+    n_upper = 0
+    removed = Counter()
+
+    def prune(heap, sign):
+        while heap and removed[sign * heap[0]]:
+            removed[sign * heap[0]] -= 1
+            heapq.heappop(heap)
+
+    def rebalance():
+        nonlocal n_lower, n_upper
+
+        if n_lower > n_upper + 1:
+            heapq.heappush(upper, -heapq.heappop(lower))
+            n_lower -= 1
+            n_upper += 1
+            prune(lower, -1)
+        elif n_lower < n_upper:
+            heapq.heappush(lower, -heapq.heappop(upper))
+            n_lower += 1
+            n_upper -= 1
+            prune(upper, 1)
+
+    def add(value):
+        nonlocal n_lower, n_upper
+
+        if not lower or value <= -lower[0]:
+            heapq.heappush(lower, -value)
+            n_lower += 1
+        else:
+            heapq.heappush(upper, value)
+            n_upper += 1
+
+        rebalance()
+
+    def remove(value):
+        nonlocal n_lower, n_upper
+
+        removed[value] += 1
+
+        if value <= -lower[0]:
+            n_lower -= 1
+            if value == -lower[0]:
+                prune(lower, -1)
+        else:
+            n_upper -= 1
+            if value == upper[0]:
+                prune(upper, 1)
+
+        rebalance()
+
+    for value in values[:window_size]:
+        add(value)
+
+    for i in range(n_rows):
+        if i > 0:
+            start = i * step
+            stop = start + window_size
+
+            for value in values[stop - step : stop]:
+                add(value)
+            for value in values[start - step : start]:
+                remove(value)
+
+        if window_size % 2 == 1:
+            medians[i] = -lower[0]
+        else:
+            medians[i] = (-lower[0] + upper[0]) / 2
+
+    return medians
+
+
+def fft_norm(sums, squared_sums, alternating_sums, window_size):
+    """Compute the L2-norm of the real FFT of windows without an FFT.
+
+    By Parseval's theorem, the squared norm of the full DFT of a window x of
+    size W is W * sum(x**2). The real FFT only returns the non-negative
+    frequencies. Every other term appears twice in the full DFT, so the
+    squared norm of the real FFT is
+
+        (W * sum(x**2) + X[0]**2 + X[W/2]**2) / 2,
+
+    where X[0] = sum(x), and X[W/2] = sum((-1)**n * x[n]) is only present
+    when W is even.
+
+    Args:
+        sums (Numpy array): Sum of the values in each window.
+        squared_sums (Numpy array): Sum of the squared values in each window.
+        alternating_sums (Numpy array): Sum of the values in each window with
+            alternating signs, starting with a positive sign.
+        window_size (int): Number of time steps in each window.
+
+    Returns:
+        Numpy array: Equal to np.linalg.norm(np.fft.rfft(window)) for each
+            window, up to rounding errors.
+
+    """
+
+    squared_norm = window_size * squared_sums + sums ** 2
+
+    if window_size % 2 == 0:
+        squared_norm += alternating_sums ** 2
+
+    # Rounding errors must not give the square root of a negative number
+    return np.sqrt(np.maximum(squared_norm, 0) / 2)
+
+
+def _window_fft_norm(windows, axis=0):
+    """Compute the L2-norm of the real FFT of windows with fft_norm().
+
+    The sums are reduced along the same axis, and with the same memory
+    layout, as the other standard features, so the standard and the
+    vectorized mode give identical results.
+
+    Args:
+        windows (Numpy array): Array holding the values of the windows.
+        axis (int): The time axis of the windows.
+
+    Returns:
+        Numpy array: The FFT-norm of each window, with `axis` removed.
+
+    """
+
+    window_size = windows.shape[axis]
+    shape = [1] * windows.ndim
+    shape[axis] = window_size
+    signs = np.where(np.arange(window_size) % 2 == 0, 1.0, -1.0).reshape(shape)
+
+    return fft_norm(
+        np.sum(windows, axis=axis),
+        np.sum(windows ** 2, axis=axis),
+        np.sum(windows * signs, axis=axis),
+        window_size,
+    )
+
+
 if __name__ == "__main__":
     # Set random seed for reproducibility
     np.random.seed(2020)
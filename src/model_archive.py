@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Archive of trained models, used for warm-start retraining.
+
+Author:
+    Erik Johannes Husom
+
+Created:
+    2026-10-16
+
+Description:
+    The pipeline overwrites the model, scaler and cluster centers each time it
+    runs. This module stores a copy of them for each model ID, together with
+    the timestamp of the latest feature vector the model was trained on, so
+    that a later model can continue training from them on newer data only.
+
+"""
+import shutil
+
+import joblib
+import numpy as np
+
+from config import *
+from preprocess_utils import load_timestamps
+
+
+def archive_model(model_id):
+    """Archive the current model, scaler and model bundle.
+
+    Args:
+        model_id (str): ID of the model.
+
+    Returns:
+        archive_path (Path): Path to the archived model.
+
+    """
+
+    archive_path = MODEL_ARCHIVE_PATH / model_id
+    archive_path.mkdir(parents=True, exist_ok=True)
+
+    shutil.copy(MODELS_FILE_PATH, archive_path / MODELS_FILE_PATH.name)
+    shutil.copy(INPUT_SCALER_PATH, archive_path / INPUT_SCALER_PATH.name)
+    shutil.copy(MODEL_BUNDLE_PATH, archive_path / MODEL_BUNDLE_PATH.name)
+
+    timestamps = load_timestamps(FEATURE_VECTOR_TIMESTAMPS_PATH)
+    np.save(archive_path / "last_timestamp.npy", np.max(timestamps, keepdims=True))
+
+    return archive_path
+
+
+def load_archived_model(model_id):
+    """Load an archived model.
+
+    Args:
+        model_id (str): ID of the model.
+
+    Returns:
+        model: The archived cluster model.
+        scaler (StandardScaler): The input scaler of the archived model.
+        last_timestamp: Timestamp of the latest feature vector the archived
+            model was trained on.
+
+    """
+
+    archive_path = MODEL_ARCHIVE_PATH / model_id
+
+    if not archive_path.exists():
+        raise FileNotFoundError(f"No archived model with ID {model_id}.")
+
+    model = joblib.load(archive_path / MODELS_FILE_PATH.name)
+    scaler = joblib.load(archive_path / INPUT_SCALER_PATH.name)
+    last_timestamp = load_timestamps(archive_path / "last_timestamp.npy")[0]
+
+    return model, scaler, last_timestamp
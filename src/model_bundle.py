@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""Binary bundle of the arrays describing a trained cluster model.
+
+Author:
+    Erik Johannes Husom
+
+Created:
+    2026-10-16
+
+Description:
+    The cluster centers, the parameters of the input scaler and the label of
+    each cluster center are stored together in one npz-file. The bundle is
+    parsed once per process and shared by all consumers, instead of each of
+    them reading the cluster centers from a csv-file.
+
+"""
+import functools
+from pathlib import Path
+
+import numpy as np
+
+from config import *
+
+
+def save_model_bundle(cluster_centers, scaler, center_labels, filepath=MODEL_BUNDLE_PATH):
+    """Save the arrays describing a cluster model.
+
+    Args:
+        cluster_centers (np.array): Cluster centers, one per row.
+        scaler (StandardScaler): Input scaler fitted on the feature vectors.
+        center_labels (np.array): The label of each cluster center.
+        filepath (str): Path to the bundle.
+
+    """
+
+    Path(filepath).parent.mkdir(parents=True, exist_ok=True)
+
+    np.savez(
+        filepath,
+        cluster_centers=np.asarray(cluster_centers),
+        center_labels=np.asarray(center_labels),
+        scaler_mean=scaler.mean_,
+        scaler_scale=scaler.scale_,
+        scaler_var=scaler.var_,
+        scaler_n_samples_seen=np.asarray(scaler.n_samples_seen_),
+    )
+
+
+def load_model_bundle(filepath=MODEL_BUNDLE_PATH):
+    """Load the arrays describing a cluster model.
+
+    The bundle is parsed only the first time it is loaded, or when the file
+    has changed since. The arrays are shared between all callers, and are
+    therefore read-only.
+
+    Args:
+        filepath (str): Path to the bundle.
+
+    Returns:
+        bundle (dict): The arrays of the bundle, by name.
+
+    """
+
+    filepath = Path(filepath).resolve()
+
+    return _load_model_bundle(filepath, filepath.stat().st_mtime_ns)
+
+
+@functools.lru_cache(maxsize=8)
+def _load_model_bundle(filepath, mtime_ns):
+    """Parse a bundle. The modification time is part of the cache key."""
+
+    bundle = {}
+
+    with np.load(filepath) as npz_file:
+        for key in npz_file.files:
+            bundle[key] = npz_file[key]
+            bundle[key].setflags(write=False)
+
+    return bundle
+
+
+def scale_feature_vectors(feature_vectors, bundle):
+    """Scale feature vectors with the scaler parameters of a bundle.
+
+    This gives the same result as the transform() method of the input scaler:
+    The parameters are kept in float64, and each in-place operation rounds to
+    the dtype of the feature vectors, as in StandardScaler.transform().
+
+    Args:
+        feature_vectors (np.array): Unscaled feature vectors.
+        bundle (dict): Model bundle.
+
+    Returns:
+        np.array: Scaled feature vectors.
+
+    """
+
+    feature_vectors = np.array(feature_vectors)
+    feature_vectors -= bundle["scaler_mean"]
+    feature_vectors /= bundle["scaler_scale"]
+
+    return feature_vectors
@@ -45,7 +45,8 @@ from cluster_utils import (
     plot_labels_over_time,
 )
 from config import *
-from preprocess_utils import find_files
+from model_bundle import load_model_bundle
+from preprocess_utils import find_files, load_timestamps, read_csv_cached
 
 
 def filter_outliers(labels, distances, percentile=95, separate_thresholds=False):
@@ -137,9 +138,7 @@ def visualize_clusters(
     """
 
     clusters = np.unique(labels)
-    cluster_centers = pd.read_csv(
-        OUTPUT_PATH / "cluster_centers.csv", index_col=0
-    ).to_numpy()
+    cluster_centers = load_model_bundle()["cluster_centers"]
 
     if mark_outliers:
         # dist = model.transform(feature_vectors)
@@ -226,9 +225,7 @@ def plot_cluster_center_distance(feature_vector_timestamps, feature_vectors, mod
         
     """
 
-    cluster_centers = pd.read_csv(
-        OUTPUT_PATH / "cluster_centers.csv", index_col=0
-    ).to_numpy()
+    cluster_centers = load_model_bundle()["cluster_centers"]
 
     # dist = model.transform(feature_vectors)
     dist = euclidean_distances(feature_vectors, cluster_centers)
@@ -244,12 +241,17 @@ def plot_cluster_center_distance(feature_vector_timestamps, feature_vectors, mod
 
     return dist, avg_dist
 
-def generate_cluster_names(model, cluster_centers):
+def generate_cluster_names(model, cluster_centers, feature_mode="standard"):
     """Generate cluster names based on the characteristics of each cluster.
 
+    The features are ordered by feature first and input column second, so with
+    several input columns, each feature name is repeated once per column.
+
     Args:
         model: Cluster model trained on input data.
         cluster_centers (np.array): Cluster centers.
+        feature_mode (str): The feature mode used to create the feature
+            vectors. See featurize.create_feature_vectors().
 
     Returns:
         cluster_names (list of str): Names based on feature characteristics.
@@ -274,11 +276,23 @@ def generate_cluster_names(model, cluster_centers):
     maxs = cluster_centers.argmax(axis=0)
     mins = cluster_centers.argmin(axis=0)
 
-    for i in range(len(FEATURE_NAMES)):
-        # cluster_names[maxs[i]] += "highest " + FEATURE_NAMES[i] + ", "
-        # cluster_names[mins[i]] += "lowest " + FEATURE_NAMES[i] + ", "
-        cluster_characteristics[maxs[i]] += "highest " + FEATURE_NAMES[i] + ", "
-        cluster_characteristics[mins[i]] += "lowest " + FEATURE_NAMES[i] + ", "
+    if feature_mode == "catch22":
+        feature_names = CATCH24_FEATURE_NAMES
+    else:
+        feature_names = FEATURE_NAMES
+
+    n_input_columns = cluster_centers.shape[1] // len(feature_names)
+
+    for i in range(cluster_centers.shape[1]):
+        feature_name = feature_names[i // n_input_columns]
+
+        if n_input_columns > 1:
+            feature_name += f" of column {i % n_input_columns}"
+
+        # cluster_names[maxs[i]] += "highest " + feature_name + ", "
+        # cluster_names[mins[i]] += "lowest " + feature_name + ", "
+        cluster_characteristics[maxs[i]] += "highest " + feature_name + ", "
+        cluster_characteristics[mins[i]] += "lowest " + feature_name + ", "
 
     print(cluster_labels)
     print(cluster_names)
@@ -323,6 +337,7 @@ def postprocess(model, cluster_centers, feature_vectors, labels):
     fix_predefined_centroids = params["train"]["fix_predefined_centroids"]
     annotations_dir = params["train"]["annotations_dir"]
     min_segment_length = params["postprocess"]["min_segment_length"]
+    metrics_sample_size = params["postprocess"].get("metrics_sample_size", None)
 
     # If the minimum segment length is set to be a non-zero value, we need to
     # filter the segments.
@@ -354,7 +369,9 @@ def postprocess(model, cluster_centers, feature_vectors, labels):
         print("No expectations found.")
 
     # Create and save cluster names
-    cluster_names = generate_cluster_names(model, cluster_centers)
+    cluster_names = generate_cluster_names(
+        model, cluster_centers, params["featurize"].get("feature_mode", "standard")
+    )
 
     # Use cluster names from annotated data, if the number of clusters still
     # matches the number of unique annotation label (the number of clusters
@@ -391,7 +408,20 @@ def postprocess(model, cluster_centers, feature_vectors, labels):
 
 
     METRICS_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    metrics = calculate_model_metrics(model, feature_vectors, labels)
+    metrics = calculate_model_metrics(
+        model, feature_vectors, labels, sample_size=metrics_sample_size
+    )
+
+    # The scores of the candidates of an n_clusters sweep are computed by the
+    # training stage, and added to the metrics of the final model together
+    # with the chosen number of clusters.
+    if N_CLUSTERS_SWEEP_PATH.exists():
+        with open(N_CLUSTERS_SWEEP_PATH, "r") as f:
+            n_clusters_sweep = json.load(f)
+
+        if n_clusters_sweep:
+            metrics["n_clusters"] = n_clusters_sweep["n_clusters"]
+            metrics["n_clusters_sweep"] = n_clusters_sweep["candidates"]
 
     with open(METRICS_FILE_PATH, "w") as f:
         json.dump(metrics, f)
@@ -499,10 +529,12 @@ if __name__ == "__main__":
 
     # Load data
     labels = pd.read_csv(LABELS_PATH).iloc[:, -1].to_numpy()
-    original_data = pd.read_csv(ORIGINAL_TIME_SERIES_PATH, index_col=0)
-    feature_vectors = np.load(FEATURE_VECTORS_PATH)
-    feature_vector_timestamps = np.load(FEATURE_VECTOR_TIMESTAMPS_PATH)
-    cluster_centers = pd.read_csv(CLUSTER_CENTERS_PATH, index_col=0).to_numpy()
+    original_data = read_csv_cached(
+        ORIGINAL_TIME_SERIES_PATH, pd.read_csv, RAW_DATA_CACHE_PATH, index_col=0
+    )
+    feature_vectors = np.load(FEATURE_VECTORS_PATH, mmap_mode="r")
+    feature_vector_timestamps = load_timestamps(FEATURE_VECTOR_TIMESTAMPS_PATH)
+    cluster_centers = load_model_bundle()["cluster_centers"]
     model = joblib.load(MODELS_FILE_PATH)
 
     labels = postprocess(model, cluster_centers, feature_vectors, labels)
@@ -9,12 +9,15 @@
 # ============================================================================
 import datetime
 import glob
+import hashlib
+import json
 import os
 import pickle
 import shutil
 import string
 import sys
 import time
+from pathlib import Path
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -90,6 +93,174 @@ def find_files(dir_path, file_extension=[]):
     return filepaths
 
 
+def read_csv_cached(filepath, parse_function, cache_dir, **parse_params):
+    """Read a csv file, using a cache of the parsed data frame.
+
+    The first time a file is read, the data frame returned by parse_function
+    is stored in cache_dir in a columnar binary format, with one npy-file for
+    the index and each column. Later reads load these files instead of parsing
+    the csv file again, as long as the path, size and modification time of
+    the file, and the parse parameters, are the same.
+
+    Args:
+        filepath (str): Path to csv file.
+        parse_function (function): Function that reads the csv file, called
+            as parse_function(filepath, **parse_params).
+        cache_dir (Path): Directory where the cached data is stored.
+        **parse_params: Parameters passed to parse_function.
+
+    Returns:
+        df (DataFrame): The parsed data frame.
+
+    """
+
+    stat = os.stat(filepath)
+
+    # One cache entry is kept for each file and set of parse parameters. The
+    # entry is overwritten if the file changes.
+    entry_key = json.dumps(
+        [os.path.abspath(filepath), sorted(parse_params.items())], default=str
+    )
+    entry_path = Path(cache_dir) / hashlib.sha1(entry_key.encode()).hexdigest()
+    file_key = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+    try:
+        with open(entry_path / "metadata.json", "r") as f:
+            metadata = json.load(f)
+
+        if metadata["file"] == file_key:
+            return _load_cached_dataframe(entry_path, metadata)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    df = parse_function(filepath, **parse_params)
+
+    _save_cached_dataframe(df, entry_path, file_key)
+
+    return df
+
+
+def _save_cached_dataframe(df, entry_path, file_key):
+    """Store a data frame as one npy-file for the index and each column."""
+
+    entry_path.mkdir(parents=True, exist_ok=True)
+
+    # Remove the metadata first, so that the entry is invalid until all
+    # columns are written.
+    metadata_path = entry_path / "metadata.json"
+    if metadata_path.exists():
+        os.remove(metadata_path)
+
+    index = df.index
+    index_tz = None
+
+    if isinstance(index, pd.DatetimeIndex) and index.tz is not None:
+        index_tz = str(index.tz)
+        index = index.tz_convert("UTC").tz_localize(None)
+
+    np.save(entry_path / "index.npy", np.asarray(index), allow_pickle=True)
+
+    for i in range(df.shape[1]):
+        np.save(
+            entry_path / f"column_{i}.npy",
+            np.asarray(df.iloc[:, i]),
+            allow_pickle=True,
+        )
+
+    metadata = {
+        "file": file_key,
+        "index_name": df.index.name,
+        "index_dtype": str(index.dtype),
+        "index_tz": index_tz,
+        "columns": list(df.columns),
+        "dtypes": [str(dtype) for dtype in df.dtypes],
+    }
+
+    with open(metadata_path, "w") as f:
+        json.dump(metadata, f, default=str)
+
+
+def _load_cached_dataframe(entry_path, metadata):
+    """Load a data frame stored by _save_cached_dataframe()."""
+
+    def load(name, dtype):
+        array = np.load(entry_path / name, allow_pickle=True)
+
+        if str(array.dtype) != dtype:
+            return pd.Series(array).astype(dtype).array
+
+        return array
+
+    index = pd.Index(
+        load("index.npy", metadata["index_dtype"]), name=metadata["index_name"]
+    )
+
+    if metadata["index_tz"] is not None:
+        index = index.tz_localize("UTC").tz_convert(metadata["index_tz"])
+
+    data = {
+        i: load(f"column_{i}.npy", dtype) for i, dtype in enumerate(metadata["dtypes"])
+    }
+
+    df = pd.DataFrame(data, index=index)
+    df.columns = metadata["columns"]
+
+    return df
+
+
+def timestamps_to_array(timestamps):
+    """Convert timestamps to an array that can be memory-mapped.
+
+    Datetimes are converted to datetime64[ns], i.e. int64 nanoseconds since
+    the epoch, and timezone-aware datetimes are converted to UTC. Numeric
+    timestamps are kept as they are. Other timestamps, like strings, are
+    returned as an object array, which cannot be memory-mapped.
+
+    Args:
+        timestamps (array-like): Timestamps.
+
+    Returns:
+        Numpy array: The timestamps.
+
+    """
+
+    timestamps = pd.Index(timestamps)
+
+    # An index of Timestamp objects is not converted to a DatetimeIndex when
+    # passed to pd.Index(), but an array of them is.
+    if timestamps.dtype == object:
+        timestamps = pd.Index(np.asarray(timestamps, dtype=object))
+
+    if isinstance(timestamps, pd.DatetimeIndex):
+        if timestamps.tz is not None:
+            timestamps = timestamps.tz_convert("UTC").tz_localize(None)
+
+        return np.asarray(timestamps).astype("datetime64[ns]")
+
+    if pd.api.types.is_numeric_dtype(timestamps):
+        return np.asarray(timestamps)
+
+    return np.asarray(timestamps, dtype=object)
+
+
+def load_timestamps(filepath):
+    """Load timestamps saved by np.save(), memory-mapped if possible.
+
+    Args:
+        filepath (str): Path to npy-file.
+
+    Returns:
+        Numpy array: The timestamps.
+
+    """
+
+    try:
+        return np.load(filepath, mmap_mode="r")
+    except ValueError:
+        # Arrays of Python objects cannot be memory-mapped.
+        return np.load(filepath, allow_pickle=True)
+
+
 def print_dataframe(df, message=""):
     """Print dataframe to terminal, with boundary and message.
 
@@ -9,19 +9,28 @@ Created:
     2021-11-29 Monday 12:05:02
 
 """
+import functools
 import json
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import joblib
 import numpy as np
 import pandas as pd
 import yaml
-from sklearn.cluster import (DBSCAN, AffinityPropagation, MeanShift,
+from sklearn.cluster import (DBSCAN, AffinityPropagation, KMeans, MeanShift,
                              MiniBatchKMeans)
 
 from annotations import *
+from cluster_utils import calculate_model_metrics
 from config import *
-from preprocess_utils import find_files
+from model_archive import load_archived_model
+from model_bundle import save_model_bundle
+from preprocess_utils import find_files, load_timestamps
+
+N_CLUSTERS_AUTO_CANDIDATES = list(range(2, 11))
+"""Candidate numbers of clusters to sweep over when n_clusters is 'auto'."""
 
 
 def train(dir_path=""):
@@ -48,13 +57,63 @@ def train(dir_path=""):
     use_predefined_centroids = params["train"]["use_predefined_centroids"]
     fix_predefined_centroids = params["train"]["fix_predefined_centroids"]
     annotations_dir = params["train"]["annotations_dir"]
-
-    # Find data files and load feature_vectors.
+    out_of_core = params["train"].get("out_of_core", False)
+    batch_size = params["train"].get("batch_size", 1024)
+    n_epochs = params["train"].get("n_epochs", 3)
+    n_jobs = params["train"].get("n_jobs", 1)
+    silhouette_sample_size = params["train"].get("silhouette_sample_size", 10000)
+    warm_start_from = params["train"].get("warm_start_from", None)
+    export_cluster_centers_csv = params["train"].get(
+        "export_cluster_centers_csv", False
+    )
+
+    # Find data files and load feature_vectors. The file is memory-mapped, so
+    # that it can share the page cache with other stages.
     filepaths = find_files(dir_path, file_extension=".npy")
-    feature_vectors = np.load(filepaths[0])
+    feature_vectors = np.load(filepaths[0], mmap_mode="r")
+
+    n_clusters_candidates = get_n_clusters_candidates(n_clusters)
+    n_clusters_sweep = {}
+
+    if n_clusters_candidates is not None and (out_of_core or use_predefined_centroids):
+        raise NotImplementedError(
+            "Sweeping over n_clusters is not implemented for out-of-core training or predefined centroids."
+        )
+
+    if warm_start_from and (
+        out_of_core or use_predefined_centroids or n_clusters_candidates is not None
+    ):
+        raise NotImplementedError(
+            "Warm start is not implemented for out-of-core training, predefined centroids or sweeping over n_clusters."
+        )
 
     model = build_model(learning_method, n_clusters, max_iter)
 
+    if out_of_core:
+        if learning_method != "minibatchkmeans" or use_predefined_centroids:
+            raise NotImplementedError(
+                "Out-of-core training is only implemented for minibatchkmeans without predefined centroids."
+            )
+
+        model = train_out_of_core(filepaths, model, batch_size, n_epochs)
+
+        params["train"]["n_clusters"] = model.cluster_centers_.shape[0]
+
+        with open("params.yaml", "w") as params_file:
+            yaml.dump(params, params_file)
+
+        save_model(
+            model,
+            model.cluster_centers_,
+            np.arange(model.cluster_centers_.shape[0]),
+            export_cluster_centers_csv,
+        )
+
+        with open(N_CLUSTERS_SWEEP_PATH, "w") as f:
+            json.dump(n_clusters_sweep, f)
+
+        return
+
     if use_predefined_centroids:
         try:
             annotations_data_filepath = find_files(
@@ -103,7 +162,20 @@ def train(dir_path=""):
         #         labels, model = fit_predict(feature_vectors, model)
         #         if C
         # else:
-        labels, model = fit_predict(feature_vectors, model)
+        if warm_start_from:
+            labels, model = warm_start(feature_vectors, warm_start_from, batch_size)
+        elif n_clusters_candidates is not None:
+            labels, model, n_clusters_sweep = sweep_n_clusters(
+                filepaths[0],
+                learning_method,
+                n_clusters_candidates,
+                max_iter,
+                n_jobs=n_jobs,
+                sample_size=silhouette_sample_size,
+            )
+            n_clusters = model.n_clusters
+        else:
+            labels, model = fit_predict(feature_vectors, model)
 
     unique_labels = np.unique(labels)
 
@@ -123,48 +195,34 @@ def train(dir_path=""):
     # - DBSCAN
     try:
         cluster_centers = model.cluster_centers_
+        center_labels = np.arange(cluster_centers.shape[0])
     except:
-        cluster_centers = []
-        for c in unique_labels:
-            current_label_feature_vectors = []
-
-            # Find the indeces of the samples to use for computing cluster
-            # centers. For models with core samples, for example DBSCAN, these
-            # will be used. Other wise all samples in each cluster will be
-            # used. The cluster centers will be the average of these samples
-            # (either core samples or all samples).
-            try:
-                samples_indeces = model.core_sample_indices_
-            except:
-                samples_indeces = np.arange(feature_vectors.shape[0])
-
-            for i in samples_indeces:
-                if labels[i] == c:
-                    current_label_feature_vectors.append(feature_vectors[i])
-
-            if current_label_feature_vectors:
-                # Convert to array
-                current_label_feature_vectors = np.array(current_label_feature_vectors)
-                # Take the average features of the core samples
-                average_feature_vector = np.average(
-                    current_label_feature_vectors, axis=0
-                )
-                # Add to the cluster centers
-                cluster_centers.append(average_feature_vector)
-
-            else:
-                # If a cluster contains no samples, add an empty cluster center
-                cluster_centers.append(np.zeros(feature_vectors.shape[-1]) * 0)
-                # np.nan)
-
-        cluster_centers = np.array(cluster_centers)
-
-    params["train"]["n_clusters"] = cluster_centers.shape[0]
-
-    # TODO: Not sure if it is a good idea to rewrite params.yaml during
-    # execution of the pipeline.
-    with open("params.yaml", "w") as params_file:
-        yaml.dump(params, params_file)
+        # The cluster centers will be the average of the core samples for
+        # models with core samples, for example DBSCAN, and otherwise of all
+        # samples in each cluster.
+        cluster_centers = compute_cluster_centers(
+            feature_vectors,
+            labels,
+            unique_labels,
+            getattr(model, "core_sample_indices_", None),
+        ).astype(feature_vectors.dtype)
+        center_labels = unique_labels
+
+    # The number of clusters chosen by a sweep is recorded in the sweep file
+    # only, since writing it to params.yaml would replace the candidates, and
+    # the next run would skip the sweep.
+    if n_clusters_candidates is None:
+        params["train"]["n_clusters"] = cluster_centers.shape[0]
+
+        # TODO: Not sure if it is a good idea to rewrite params.yaml during
+        # execution of the pipeline.
+        with open("params.yaml", "w") as params_file:
+            yaml.dump(params, params_file)
+    else:
+        n_clusters_sweep = {
+            "n_clusters": int(cluster_centers.shape[0]),
+            "candidates": n_clusters_sweep,
+        }
 
     # Clustering algorithms like AffinityPropagation might fail to converge,
     # so MiniBatchKMeans serves as a fallback method.
@@ -175,10 +233,11 @@ def train(dir_path=""):
 
     # Save output to disk
     OUTPUT_PATH.parent.mkdir(parents=True, exist_ok=True)
-    MODELS_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
-    joblib.dump(model, MODELS_FILE_PATH)
+    save_model(model, cluster_centers, center_labels, export_cluster_centers_csv)
     pd.DataFrame(labels).to_csv(LABELS_PATH)
-    pd.DataFrame(cluster_centers).to_csv(CLUSTER_CENTERS_PATH)
+
+    with open(N_CLUSTERS_SWEEP_PATH, "w") as f:
+        json.dump(n_clusters_sweep, f)
 
     # print("=======================")
     # print("AFTER")
@@ -187,6 +246,309 @@ def train(dir_path=""):
     # print("=======================")
 
 
+def save_model(model, cluster_centers, center_labels, export_csv=False):
+    """Save the model, and the bundle of arrays describing it.
+
+    Args:
+        model: Trained cluster model.
+        cluster_centers (np.array): Cluster centers.
+        center_labels (np.array): The label of each cluster center.
+        export_csv (bool): Whether to also export the cluster centers to a
+            csv-file.
+
+    """
+
+    MODELS_FILE_PATH.parent.mkdir(parents=True, exist_ok=True)
+    joblib.dump(model, MODELS_FILE_PATH)
+    save_model_bundle(cluster_centers, joblib.load(INPUT_SCALER_PATH), center_labels)
+
+    if export_csv:
+        pd.DataFrame(cluster_centers).to_csv(CLUSTER_CENTERS_PATH)
+
+
+def train_out_of_core(filepaths, model, batch_size, n_epochs):
+    """Train a MiniBatchKMeans model without loading all feature vectors.
+
+    The model is fitted with partial_fit() on batches read from the
+    memory-mapped feature vector files, and the labels are then predicted
+    batch by batch and written to the labels file. The memory usage is
+    bounded by the batch size, regardless of the number of feature vectors.
+
+    Args:
+        filepaths (list): Paths to npy-files containing feature vectors. The
+            feature vectors are labeled in the order of the files.
+        model (MiniBatchKMeans): The model to train.
+        batch_size (int): Number of feature vectors in each batch.
+        n_epochs (int): Number of passes over all feature vectors.
+
+    Returns:
+        model (MiniBatchKMeans): The trained model.
+
+    """
+
+    shards = [np.load(filepath, mmap_mode="r") for filepath in filepaths]
+
+    # The first batch is used to initialize the cluster centers, and must
+    # contain at least one sample per cluster.
+    batch_size = max(batch_size, model.n_clusters)
+
+    batches = [
+        (shard, start)
+        for shard in shards
+        for start in range(0, shard.shape[0], batch_size)
+    ]
+
+    # The batches are visited in random order, since the feature vectors are
+    # ordered in time, and consecutive batches are therefore not
+    # representative of the whole data set.
+    rng = np.random.default_rng(2020)
+
+    for epoch in range(n_epochs):
+        for i in rng.permutation(len(batches)):
+            shard, start = batches[i]
+            batch = np.asarray(shard[start : start + batch_size])
+
+            if batch.shape[0] < model.n_clusters and not hasattr(
+                model, "cluster_centers_"
+            ):
+                continue
+
+            model.partial_fit(batch)
+
+    # Predict labels batch by batch, and append them to the labels file in the
+    # same format as when all labels are written at once.
+    OUTPUT_PATH.mkdir(parents=True, exist_ok=True)
+    n_labels = 0
+
+    for shard in shards:
+        for start in range(0, shard.shape[0], batch_size):
+            labels = model.predict(np.asarray(shard[start : start + batch_size]))
+
+            pd.DataFrame(
+                labels, index=pd.RangeIndex(n_labels, n_labels + len(labels))
+            ).to_csv(
+                LABELS_PATH,
+                mode="w" if n_labels == 0 else "a",
+                header=n_labels == 0,
+            )
+
+            n_labels += len(labels)
+
+    return model
+
+
+def warm_start(feature_vectors, model_id, batch_size):
+    """Continue training an archived MiniBatchKMeans model on new data.
+
+    The archived model is updated with partial_fit() in a single pass over
+    the feature vectors that are newer than those it was trained on, so the
+    training time depends on the amount of new data only. The cluster
+    centers keep their order, and random reassignment of centers is turned
+    off, so that the labels of the archived model keep their identity.
+
+    Args:
+        feature_vectors (np.array): All feature vectors, scaled with the
+            current input scaler.
+        model_id (str): ID of the archived model.
+        batch_size (int): Number of feature vectors in each call to
+            partial_fit().
+
+    Returns:
+        labels (np.array): Cluster labels of all feature vectors.
+        model (MiniBatchKMeans): The updated model.
+
+    """
+
+    model, previous_scaler, last_timestamp = load_archived_model(model_id)
+
+    if not isinstance(model, MiniBatchKMeans):
+        raise NotImplementedError(
+            "Warm start is only implemented for minibatchkmeans."
+        )
+
+    # The input scaler has been updated with the new data, so the cluster
+    # centers are moved from the feature space of the archived scaler.
+    scaler = joblib.load(INPUT_SCALER_PATH)
+    model.cluster_centers_ = scaler.transform(
+        previous_scaler.inverse_transform(model.cluster_centers_)
+    )
+    model.set_params(reassignment_ratio=0)
+
+    timestamps = load_timestamps(FEATURE_VECTOR_TIMESTAMPS_PATH)
+    new_indices = np.flatnonzero(timestamps > last_timestamp)
+
+    for start in range(0, len(new_indices), batch_size):
+        batch_indices = new_indices[start : start + batch_size]
+        model.partial_fit(np.asarray(feature_vectors[batch_indices]))
+
+    labels = model.predict(feature_vectors)
+
+    return labels, model
+
+
+def compute_cluster_centers(
+    feature_vectors, labels, unique_labels, sample_indices=None
+):
+    """Compute cluster centers as the average of the samples in each cluster.
+
+    The samples are summed per cluster in a single pass over the feature
+    vectors, in batches to bound the memory usage.
+
+    Args:
+        feature_vectors (np.array): Feature vectors.
+        labels (np.array): Cluster label of each feature vector.
+        unique_labels (np.array): Sorted labels to compute centers for.
+        sample_indices (np.array, optional): Indices of the samples to use,
+            for example the core samples of DBSCAN. If None, all samples are
+            used.
+
+    Returns:
+        cluster_centers (np.array): One center per label in unique_labels.
+            Clusters without samples get a center of zeros.
+
+    """
+
+    n_clusters = len(unique_labels)
+    n_features = feature_vectors.shape[-1]
+
+    if sample_indices is None:
+        sample_indices = np.arange(len(labels))
+
+    sums = np.zeros((n_clusters, n_features))
+    counts = np.zeros(n_clusters, dtype=np.int64)
+    batch_size = max(1, 2**22 // n_features)
+
+    for start in range(0, len(sample_indices), batch_size):
+        batch_indices = sample_indices[start : start + batch_size]
+        cluster_indices = np.searchsorted(unique_labels, labels[batch_indices])
+
+        np.add.at(sums, cluster_indices, np.asarray(feature_vectors[batch_indices]))
+        counts += np.bincount(cluster_indices, minlength=n_clusters)
+
+    cluster_centers = np.zeros((n_clusters, n_features))
+    non_empty = counts > 0
+    cluster_centers[non_empty] = sums[non_empty] / counts[non_empty, None]
+
+    return cluster_centers
+
+
+def get_n_clusters_candidates(n_clusters):
+    """Get the candidate numbers of clusters to sweep over.
+
+    Args:
+        n_clusters (int, str or list): The n_clusters parameter. Either a
+            fixed number of clusters, 'auto', or a list of candidates.
+
+    Returns:
+        candidates (list): Candidate numbers of clusters, or None if
+            n_clusters is a fixed number.
+
+    """
+
+    if n_clusters == "auto":
+        return N_CLUSTERS_AUTO_CANDIDATES
+    elif isinstance(n_clusters, list):
+        return [int(n) for n in n_clusters]
+    else:
+        return None
+
+
+def sweep_n_clusters(
+    filepath, learning_method, candidates, max_iter, n_jobs=1, sample_size=None
+):
+    """Fit one model per candidate number of clusters, and keep the best.
+
+    The candidates are fitted in parallel processes, which memory-map the
+    same feature vector file. The models are scored with the silhouette
+    score, computed on a seeded sample of the feature vectors.
+
+    Args:
+        filepath (str): Path to npy-file containing feature vectors.
+        learning_method (str): Clustering method. Must take the number of
+            clusters as a parameter.
+        candidates (list): Candidate numbers of clusters.
+        max_iter (int): Maximum iterations.
+        n_jobs (int): Number of processes to fit the candidates in.
+        sample_size (int): Number of feature vectors to compute the
+            silhouette score on. If None, all feature vectors are used.
+
+    Returns:
+        labels (np.array): Labels of the best model.
+        model: The best model.
+        sweep (dict): Metrics, fit time and score time of each candidate,
+            keyed by number of clusters.
+
+    """
+
+    if learning_method not in ("minibatchkmeans", "kmeans_elkan"):
+        raise NotImplementedError(
+            f"Sweeping over n_clusters is not implemented for {learning_method}."
+        )
+
+    fit_candidate = functools.partial(
+        _fit_candidate,
+        filepath,
+        learning_method,
+        max_iter=max_iter,
+        sample_size=sample_size,
+    )
+
+    if n_jobs > 1:
+        with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+            results = list(executor.map(fit_candidate, candidates))
+    else:
+        results = [fit_candidate(n_clusters) for n_clusters in candidates]
+
+    sweep = {
+        str(n_clusters): metrics
+        for n_clusters, (_, _, metrics) in zip(candidates, results)
+    }
+
+    best_model, best_labels, _ = max(
+        results, key=lambda result: result[2]["silhouette_score"]
+    )
+
+    return best_labels, best_model, sweep
+
+
+def _fit_candidate(filepath, learning_method, n_clusters, max_iter, sample_size):
+    """Fit and score a model with the given number of clusters.
+
+    Args:
+        filepath (str): Path to npy-file containing feature vectors.
+        learning_method (str): Clustering method.
+        n_clusters (int): Number of clusters.
+        max_iter (int): Maximum iterations.
+        sample_size (int): Number of feature vectors to compute the
+            silhouette score on.
+
+    Returns:
+        model: The fitted model.
+        labels (np.array): Cluster labels.
+        metrics (dict): Model metrics, fit time and score time.
+
+    """
+
+    feature_vectors = np.load(filepath, mmap_mode="r")
+    model = build_model(learning_method, n_clusters, max_iter)
+
+    start = time.perf_counter()
+    labels, model = fit_predict(feature_vectors, model)
+    fit_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    metrics = calculate_model_metrics(
+        model, feature_vectors, labels, sample_size=sample_size
+    )
+    score_time = time.perf_counter() - start
+
+    metrics = {key: float(value) for key, value in metrics.items()}
+    metrics["fit_time"] = fit_time
+    metrics["score_time"] = score_time
+
+    return model, labels, metrics
+
+
 def build_model(learning_method, n_clusters, max_iter):
     """Build clustering model.
 
@@ -203,6 +565,13 @@ def build_model(learning_method, n_clusters, max_iter):
         model = MeanShift()
     elif learning_method == "minibatchkmeans":
         model = MiniBatchKMeans(n_clusters=n_clusters, max_iter=max_iter)
+    # Full-batch k-means with Elkan's algorithm, which uses the triangle
+    # inequality to skip most of the distance computations. It is faster
+    # than MiniBatchKMeans for large numbers of clusters.
+    elif learning_method == "kmeans_elkan":
+        model = KMeans(
+            n_clusters=n_clusters, max_iter=max_iter, n_init=1, algorithm="elkan"
+        )
     elif learning_method == "affinitypropagation":
         model = AffinityPropagation(damping=0.9, max_iter=1000, verbose=True)
     # TODO: To make DBSCAN work, we need to manually compute cluster centroids
@@ -252,7 +621,7 @@ def fit_predict_with_predefined_centroids(
     for key in predefined_centroids_dict:
         predefined_centroids.append(predefined_centroids_dict[key])
 
-    predefined_centroids = np.array(predefined_centroids)
+    predefined_centroids = np.array(predefined_centroids, dtype=feature_vectors.dtype)
 
     # If the number of predefined clusters is greater than the parameter
     # n_clusters, the former will override the latter.
@@ -277,6 +646,14 @@ def fit_predict_with_predefined_centroids(
         else:
             if learning_method == "meanshift":
                 model = MeanShift(seeds=predefined_centroids)
+            elif learning_method == "kmeans_elkan":
+                model = KMeans(
+                    max_iter=max_iter,
+                    n_clusters=n_clusters,
+                    init=predefined_centroids,
+                    n_init=1,
+                    algorithm="elkan",
+                )
             elif learning_method == "minibatchkmeans":
                 model = MiniBatchKMeans(
                     max_iter=max_iter, n_clusters=n_clusters, init=predefined_centroids
@@ -306,26 +683,29 @@ def fit_predict_with_predefined_centroids(
         initial_centroids[0 : predefined_centroids.shape[0], :] = predefined_centroids
 
         if fix_predefined_centroids:
-            current_centroids = initial_centroids
-
-            for i in range(max_iter):
-                model = MiniBatchKMeans(
-                    max_iter=1, n_clusters=n_clusters, init=current_centroids
-                )
-
-                model.fit(feature_vectors)
-                current_centroids = model.cluster_centers_
-
-                # Overwrite some of the current centroids with the predefined ones.
-                current_centroids[
-                    0 : predefined_centroids.shape[0], :
-                ] = predefined_centroids
+            # Only the extra centroids are updated, while the predefined ones
+            # stay fixed.
+            cluster_centers, labels, n_iter = constrained_kmeans(
+                feature_vectors,
+                initial_centroids,
+                predefined_centroids.shape[0],
+                max_iter=max_iter,
+            )
 
-            labels = model.predict(feature_vectors)
+            model.cluster_centers_ = cluster_centers
+            model.n_iter_ = n_iter
 
         else:
             if learning_method == "meanshift":
                 model = MeanShift(seeds=initial_centroids)
+            elif learning_method == "kmeans_elkan":
+                model = KMeans(
+                    max_iter=max_iter,
+                    n_clusters=n_clusters,
+                    init=initial_centroids,
+                    n_init=1,
+                    algorithm="elkan",
+                )
             elif learning_method == "minibatchkmeans":
                 model = MiniBatchKMeans(
                     max_iter=max_iter, n_clusters=n_clusters, init=initial_centroids
@@ -343,6 +723,97 @@ def fit_predict_with_predefined_centroids(
         return labels, model
 
 
+def constrained_kmeans(
+    feature_vectors, initial_centroids, n_fixed, max_iter=100, tol=1e-4
+):
+    """Run k-means where some of the centroids are fixed.
+
+    Each iteration assigns all feature vectors to their nearest centroid, and
+    moves each of the centroids that are not fixed to the mean of its feature
+    vectors. The feature vectors are processed in batches to bound the memory
+    usage. The iterations stop early when the centroids move less than the
+    tolerance.
+
+    Args:
+        feature_vectors (np.array): Feature vectors.
+        initial_centroids (np.array): Initial centroids. The first n_fixed
+            centroids are fixed.
+        n_fixed (int): Number of fixed centroids.
+        max_iter (int): Maximum number of iterations.
+        tol (float): Tolerance of the squared distance the centroids move in
+            an iteration, relative to the mean variance of the features, as
+            in scikit-learn's KMeans.
+
+    Returns:
+        centroids (np.array): Final centroids.
+        labels (np.array): Index of the nearest centroid of each feature
+            vector.
+        n_iter (int): Number of iterations run.
+
+    """
+
+    n_samples, n_features = feature_vectors.shape
+    n_clusters = initial_centroids.shape[0]
+    centroids = np.array(initial_centroids, dtype=feature_vectors.dtype)
+    free = np.arange(n_clusters) >= n_fixed
+    batch_size = max(1, 2**22 // max(n_clusters, n_features))
+
+    # The variance of the features is accumulated in batches, like the rest
+    # of the computations. The feature vectors are shifted by the first one to
+    # limit the loss of precision of the sums of squares.
+    shift = np.asarray(feature_vectors[0], dtype=np.float64)
+    feature_sums = np.zeros(n_features)
+    feature_squared_sums = np.zeros(n_features)
+
+    for start in range(0, n_samples, batch_size):
+        batch = np.asarray(feature_vectors[start : start + batch_size]) - shift
+        feature_sums += batch.sum(axis=0)
+        feature_squared_sums += np.einsum("ij,ij->j", batch, batch)
+
+    variance = feature_squared_sums / n_samples - (feature_sums / n_samples) ** 2
+    tol = tol * np.mean(np.maximum(variance, 0))
+
+    def assign(centroids):
+        labels = np.empty(n_samples, dtype=np.int64)
+        sums = np.zeros((n_clusters, n_features))
+        squared_norms = np.einsum("ij,ij->i", centroids, centroids)
+
+        for start in range(0, n_samples, batch_size):
+            batch = np.asarray(feature_vectors[start : start + batch_size])
+            batch_labels = np.argmin(squared_norms - 2 * batch @ centroids.T, axis=1)
+            np.add.at(sums, batch_labels, batch)
+            labels[start : start + batch_size] = batch_labels
+
+        return labels, sums
+
+    start_time = time.perf_counter()
+
+    for n_iter in range(1, max_iter + 1):
+        labels, sums = assign(centroids)
+        counts = np.bincount(labels, minlength=n_clusters)
+
+        # Centroids without any feature vectors are left where they are
+        update = free & (counts > 0)
+        new_centroids = centroids.copy()
+        new_centroids[update] = sums[update] / counts[update, None]
+
+        center_shift = np.sum((new_centroids - centroids) ** 2)
+        centroids = new_centroids
+
+        if center_shift <= tol:
+            break
+
+    labels, _ = assign(centroids)
+
+    elapsed = time.perf_counter() - start_time
+    print(
+        f"Constrained k-means ran {n_iter} iterations, "
+        f"{elapsed / n_iter:.4f} s per iteration."
+    )
+
+    return centroids, labels, n_iter
+
+
 def predict(feature_vectors, model):
     labels = model.predict(feature_vectors)
 
@@ -9,20 +9,39 @@ Created:
     2022-06-09 torsdag 13:44:41 
 
 """
+import importlib.util
 import json
 import os
 import shutil
 import subprocess
 import sys
+import tempfile
 import unittest
 from pathlib import Path
 
+import joblib
 import numpy as np
 import pandas as pd
 import yaml
+from scipy.spatial.distance import cosine
+from sklearn.cluster import DBSCAN, MiniBatchKMeans
+from sklearn.metrics import (
+    calinski_harabasz_score,
+    davies_bouldin_score,
+    silhouette_score,
+)
+from sklearn.preprocessing import StandardScaler
 
 sys.path.append("src/")
-import cluster
+import cluster_utils as cluster
+from clustermodel import ClusterModel
+import featurize
+import model_archive
+import model_bundle
+import postprocess
+import preprocess_utils
+import train
+from config import LABELS_PATH
 
 
 class TestUDAVA(unittest.TestCase):
@@ -43,6 +62,867 @@ class TestUDAVA(unittest.TestCase):
 
         np.testing.assert_array_equal(segments, expected_segments)
 
+    def test_find_segments_edge_cases(self):
+        """Test find_segments() on single labels and single-element
+        segments."""
+
+        np.testing.assert_array_equal(cluster.find_segments([3]), [[0, 3, 1, 0, 0]])
+        np.testing.assert_array_equal(
+            cluster.find_segments([1, 1, 2]), [[0, 1, 2, 0, 1], [1, 2, 1, 2, 2]]
+        )
+        np.testing.assert_array_equal(
+            cluster.find_segments([1, 2, 2]), [[0, 1, 1, 0, 0], [1, 2, 2, 1, 2]]
+        )
+        self.assertEqual(cluster.find_segments([]).shape, (0, 5))
+
+    def test_create_event_log(self):
+        """Test whether create_event_log() returns expected results."""
+
+        labels = np.array([0, 0, 1, 1, 1, 0, 0, 0, 0, 2, 2, 2])
+        timestamps = pd.date_range("2020-01-01", periods=len(labels), freq="min")
+
+        event_log = cluster.create_event_log(
+            labels, identifier="test", feature_vector_timestamps=timestamps
+        )
+
+        expected_event_log = pd.DataFrame(
+            {
+                "timestamp": timestamps[[0, 1, 2, 4, 5, 8, 9, 11]],
+                "label": [0, 0, 1, 1, 0, 0, 2, 2],
+                "status": ["started", "completed"] * 4,
+                "source": ["test"] * 8,
+                "case": [""] * 8,
+            }
+        )
+
+        pd.testing.assert_frame_equal(event_log, expected_event_log)
+
+        # Column vectors, as used by the API, give the same event log
+        event_log = cluster.create_event_log(
+            labels.reshape(-1, 1),
+            identifier="test",
+            feature_vector_timestamps=np.asarray(timestamps).reshape(-1, 1),
+        )
+
+        pd.testing.assert_frame_equal(event_log, expected_event_log)
+
+        columns = cluster.create_event_log(
+            labels,
+            identifier="test",
+            feature_vector_timestamps=timestamps,
+            output="numpy",
+        )
+
+        for name, column in expected_event_log.items():
+            np.testing.assert_array_equal(columns[name], column.to_numpy())
+
+    @unittest.skipUnless(importlib.util.find_spec("pyarrow"), "requires pyarrow")
+    def test_create_event_log_arrow(self):
+        """Test that the event log can be created as an Arrow table."""
+
+        labels = np.array([0, 0, 1, 1, 1, 0, 0, 0, 0, 2, 2, 2])
+        timestamps = pd.date_range("2020-01-01", periods=len(labels), freq="min")
+
+        table = cluster.create_event_log(
+            labels,
+            identifier="test",
+            feature_vector_timestamps=timestamps,
+            output="arrow",
+        )
+        event_log = cluster.create_event_log(
+            labels, identifier="test", feature_vector_timestamps=timestamps
+        )
+
+        self.assertEqual(table.column_names, list(event_log.columns))
+        self.assertEqual(table.column("label").to_pylist(), event_log["label"].tolist())
+
+    def test_filter_segments(self):
+        """Test whether filter_segments() merges each short segment into the
+        expected neighbor."""
+
+        def distances_to_centers(labels, second_closest, n_clusters):
+            # Each feature vector is closest to its label, and second closest
+            # to the given cluster center.
+            distances = np.full((len(labels), n_clusters), 2.0)
+            distances[np.arange(len(labels)), labels] = 0
+            distances[np.arange(len(labels)), second_closest] = 1
+            return distances
+
+        for labels, second_closest, n_clusters, min_segment_length, expected in [
+            # Merged into the previous segment
+            ([0, 0, 0, 0, 1, 2, 2, 2, 2], [1] * 4 + [0] + [0] * 4, 3, 2,
+             [0, 0, 0, 0, 0, 2, 2, 2, 2]),
+            # Merged into the next segment
+            ([0, 0, 0, 0, 1, 2, 2, 2, 2], [1] * 4 + [2] + [0] * 4, 3, 2,
+             [0, 0, 0, 0, 2, 2, 2, 2, 2]),
+            # Split between the neighbors
+            ([0, 0, 0, 0, 1, 1, 2, 2, 2, 2], [1] * 4 + [3, 3] + [0] * 4, 4, 3,
+             [0, 0, 0, 0, 0, 2, 2, 2, 2, 2]),
+            # The first and last segments only have one neighbor
+            ([1, 0, 0, 0], [2, 1, 1, 1], 3, 2, [0, 0, 0, 0]),
+            ([0, 0, 0, 1], [1, 1, 1, 2], 3, 2, [0, 0, 0, 0]),
+            # The neighbors are joined when they get the same label
+            ([0, 0, 0, 1, 0, 0, 0, 2, 0, 0], [1, 1, 1, 0, 1, 1, 1, 0, 1, 1], 3, 2,
+             [0] * 10),
+            # Ties are resolved by filtering the earliest segment first
+            ([0, 0, 0, 1, 2, 3, 3, 3], [1, 1, 1, 2, 1, 0, 0, 0], 4, 2,
+             [0, 0, 0, 2, 2, 3, 3, 3]),
+        ]:
+            labels = np.array(labels)
+            distances = distances_to_centers(labels, second_closest, n_clusters)
+
+            np.testing.assert_array_equal(
+                cluster.filter_segments(labels, min_segment_length, distances),
+                expected,
+            )
+
+        rng = np.random.default_rng(2020)
+
+        for n_labels, n_clusters, min_segment_length in [
+            (2000, 2, 5),
+            (2000, 5, 10),
+            (500, 8, 30),
+        ]:
+            segment_lengths = rng.geometric(1 / 4, size=n_labels)
+            segment_labels = rng.integers(0, n_clusters, size=n_labels)
+            labels = np.repeat(segment_labels, segment_lengths)[:n_labels]
+            distances_to_centers = rng.random((n_labels, n_clusters))
+
+            original_distances = distances_to_centers.copy()
+            new_labels = cluster.filter_segments(
+                labels, min_segment_length, distances_to_centers
+            )
+
+            np.testing.assert_array_equal(distances_to_centers, original_distances)
+            np.testing.assert_array_equal(
+                cluster.find_closest_cluster_centers(distances_to_centers),
+                np.argsort(distances_to_centers, axis=1)[:, :2],
+            )
+            self.assertGreaterEqual(
+                cluster.find_segments(new_labels)[:, 2].min(), min_segment_length
+            )
+
+        # A single segment is left as it is
+        labels = np.zeros(3, dtype=int)
+        new_labels = cluster.filter_segments(labels, 5, rng.random((3, 2)))
+
+        np.testing.assert_array_equal(new_labels, labels)
+
+    def test_vectorized_feature_vectors(self):
+        """Test that the vectorized mode gives the same output as standard."""
+
+        rng = np.random.default_rng(2020)
+        df = pd.DataFrame(
+            rng.normal(size=(1003, 3)),
+            index=pd.date_range("2022-06-09", periods=1003, freq="100ms"),
+        )
+
+        for window_size, overlap in [(30, 0), (10, 9), (7, 2)]:
+            expected_features, expected_timestamps = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap
+            )
+            features, timestamps = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap, mode="vectorized"
+            )
+
+            np.testing.assert_array_equal(features, expected_features)
+            self.assertTrue(timestamps.equals(expected_timestamps))
+
+    def test_incremental_feature_vectors(self):
+        """Test that the incremental mode gives the same output as standard,
+        up to rounding errors."""
+
+        rng = np.random.default_rng(2020)
+        df = pd.DataFrame(rng.normal(loc=100, size=(1003, 2)))
+
+        for window_size, overlap in [(30, 29), (10, 9), (7, 2), (20, 0)]:
+            expected_features, expected_timestamps = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap
+            )
+            features, timestamps = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap, mode="incremental"
+            )
+
+            np.testing.assert_allclose(features, expected_features, atol=1e-9)
+            self.assertTrue(timestamps.equals(expected_timestamps))
+
+    def test_incremental_feature_vectors_long_series(self):
+        """Test that the precision of the incremental mode does not degrade
+        on long series with level shifts and little noise."""
+
+        rng = np.random.default_rng(2020)
+        levels = np.repeat(rng.choice([0.0, 5000.0], size=200), 1000)
+        df = pd.DataFrame(levels + rng.normal(scale=0.01, size=len(levels)))
+
+        expected_features, _ = featurize.create_feature_vectors(
+            df, df.index, 30, 29, mode="vectorized", n_windows=len(df) - 30
+        )
+        features, _ = featurize.create_feature_vectors(
+            df, df.index, 30, 29, mode="incremental", n_windows=len(df) - 30
+        )
+
+        np.testing.assert_allclose(features, expected_features, rtol=1e-3, atol=1e-6)
+
+    def test_incremental_feature_vectors_with_nan(self):
+        """Test that windows containing NaN get the same features as in the
+        standard mode, without affecting the other windows."""
+
+        rng = np.random.default_rng(2020)
+        df = pd.DataFrame(rng.normal(loc=100, size=(1003, 2)))
+        df.iloc[[5, 500, 501], 0] = np.nan
+        df.iloc[700, 1] = np.nan
+
+        for window_size, overlap in [(30, 29), (7, 2), (20, 0)]:
+            expected_features, _ = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap
+            )
+            features, _ = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap, mode="incremental"
+            )
+
+            np.testing.assert_allclose(features, expected_features, atol=1e-9)
+
+        # With a large offset, a NaN must not ruin the precision of the
+        # windows next to it.
+        df = pd.DataFrame(rng.normal(loc=1e9, size=(1003, 2)))
+        df.iloc[[0, 100], 0] = np.nan
+
+        expected_features, _ = featurize.create_feature_vectors(df, df.index, 30, 29)
+        features, _ = featurize.create_feature_vectors(
+            df, df.index, 30, 29, mode="incremental"
+        )
+
+        np.testing.assert_allclose(features, expected_features, rtol=1e-9, atol=1e-5)
+
+    def test_fft_norm(self):
+        """Test that the FFT-norm computed by Parseval's theorem is equal to
+        the norm of the real FFT."""
+
+        rng = np.random.default_rng(2020)
+
+        for window_size in [2, 7, 30, 31]:
+            windows = rng.normal(loc=10, size=(100, window_size))
+            signs = (-1) ** np.arange(window_size)
+
+            norm = featurize.fft_norm(
+                windows.sum(axis=1),
+                (windows ** 2).sum(axis=1),
+                (windows * signs).sum(axis=1),
+                window_size,
+            )
+            expected = np.linalg.norm(np.fft.rfft(windows, axis=1), axis=1, ord=2)
+
+            np.testing.assert_allclose(norm, expected, rtol=1e-12)
+            np.testing.assert_allclose(
+                featurize._window_fft_norm(windows.T, axis=0), expected, rtol=1e-12
+            )
+
+    def test_catch22_feature_vectors(self):
+        """Test that the catch22 mode computes the features of each column."""
+
+        rng = np.random.default_rng(2020)
+        df = pd.DataFrame(rng.normal(size=(100, 2)))
+
+        features, _ = featurize.create_feature_vectors(
+            df, df.index, 50, 0, mode="catch22"
+        )
+
+        self.assertEqual(features.shape, (2, 48))
+
+        for i in range(2):
+            for j in range(2):
+                window = df.iloc[i * 50 : (i + 1) * 50, j].tolist()
+                expected = featurize.pycatch22.catch22_all(window, catch24=True)
+                np.testing.assert_allclose(
+                    features[i, j::2], np.nan_to_num(expected["values"])
+                )
+
+    def test_feature_vectors_in_shards(self):
+        """Test that splitting the windows into shards processed in parallel
+        gives the same output as processing all windows at once."""
+
+        rng = np.random.default_rng(2020)
+        df = pd.DataFrame(
+            rng.normal(size=(1003, 2)),
+            index=pd.date_range("2022-06-09", periods=1003, freq="100ms"),
+        )
+
+        for window_size, overlap in [(30, 0), (10, 9)]:
+            expected_features, expected_timestamps = featurize.create_feature_vectors(
+                df, df.index, window_size, overlap
+            )
+
+            for executor in ["thread", "process", "auto"]:
+                features, timestamps = featurize.create_feature_vectors(
+                    df, df.index, window_size, overlap, n_jobs=3, executor=executor
+                )
+
+                np.testing.assert_array_equal(features, expected_features)
+                self.assertTrue(timestamps.equals(expected_timestamps))
+
+    def run_featurize(self, tmp_dir, train_params=None, **featurize_params):
+        """Run featurize() on two synthetic csv files in tmp_dir.
+
+        Args:
+            train_params (dict): Parameters of the train stage, written to
+                params.yaml together with the featurize parameters.
+
+        Returns:
+            tuple: Feature vectors, feature vector timestamps and original
+                data written by featurize().
+
+        """
+
+        cwd = os.getcwd()
+        os.chdir(tmp_dir)
+
+        try:
+            data_dir = Path("assets/data/raw/data")
+
+            if not data_dir.exists():
+                data_dir.mkdir(parents=True)
+                rng = np.random.default_rng(2020)
+
+                for i in range(2):
+                    df = pd.DataFrame(
+                        {
+                            "Date": pd.date_range(
+                                f"2022-06-0{i + 1}", periods=1013, freq="1s"
+                            ),
+                            "variable": rng.normal(size=1013) * (i + 1),
+                            "other": rng.normal(size=1013),
+                        }
+                    )
+                    df.to_csv(data_dir / f"data{i}.csv", index=False)
+
+            params = {
+                "featurize": {
+                    "dataset": "data",
+                    "columns": "variable",
+                    "window_size": 20,
+                    "overlap": 0,
+                    "timestamp_column": "Date",
+                    "convert_timestamp_to_datetime": True,
+                }
+            }
+            params["featurize"].update(featurize_params)
+
+            if train_params is not None:
+                params["train"] = train_params
+
+            with open("params.yaml", "w") as f:
+                yaml.dump(params, f)
+
+            featurize.featurize("assets/data/raw")
+
+            return (
+                np.load(featurize.FEATURE_VECTORS_PATH),
+                np.load(featurize.FEATURE_VECTOR_TIMESTAMPS_PATH, allow_pickle=True),
+                pd.read_csv(featurize.ORIGINAL_TIME_SERIES_PATH),
+            )
+        finally:
+            os.chdir(cwd)
+
+    def test_featurize_in_chunks(self):
+        """Test that featurizing in chunks gives the same output as reading
+        the whole files at once."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # With overlap = window_size - 1, the timestamp of a window is the
+            # one right after it, which must be kept in the chunk.
+            for overlap in [0, 5, 19]:
+                expected = self.run_featurize(tmp_dir, overlap=overlap)
+                output = self.run_featurize(tmp_dir, overlap=overlap, chunk_size=37)
+
+                np.testing.assert_allclose(output[0], expected[0])
+                np.testing.assert_array_equal(output[1], expected[1])
+                pd.testing.assert_frame_equal(output[2], expected[2])
+
+    def test_featurize_online_scaler(self):
+        """Test that the incrementally fitted scaler gives the same output as
+        fitting on all feature vectors at once."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            feature_vectors, _, _ = self.run_featurize(tmp_dir, chunk_size=97)
+
+            unscaled = []
+            for i in range(2):
+                df = featurize.read_raw_data(
+                    Path(tmp_dir) / f"assets/data/raw/data/data{i}.csv", "Date", True
+                )
+                unscaled.append(
+                    featurize._featurize(df, "variable", 20, 0, "Date").to_numpy()
+                )
+
+            expected = StandardScaler().fit_transform(np.concatenate(unscaled))
+
+            np.testing.assert_allclose(feature_vectors, expected)
+
+    def test_featurize_memory_mapped_output(self):
+        """Test that the feature vectors and timestamps can be memory-mapped."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            feature_vectors, timestamps, original_data = self.run_featurize(tmp_dir)
+
+            self.assertEqual(timestamps.dtype, np.dtype("datetime64[ns]"))
+
+            for path in [
+                featurize.FEATURE_VECTORS_PATH,
+                featurize.FEATURE_VECTOR_TIMESTAMPS_PATH,
+            ]:
+                array = np.load(Path(tmp_dir) / path, mmap_mode="r")
+                self.assertIsInstance(array, np.memmap)
+
+            np.testing.assert_array_equal(
+                timestamps[:2],
+                pd.to_datetime(original_data["Date"]).to_numpy()[[10, 30]],
+            )
+
+    def test_read_csv_cached(self):
+        """Test that cached raw data is equal to the parsed csv file, and that
+        the cache is updated when the file changes."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = Path(tmp_dir) / "data.csv"
+            cache_dir = Path(tmp_dir) / "cache"
+
+            df = pd.DataFrame(
+                {
+                    "Date": pd.date_range("2022-06-09", periods=10, freq="1s"),
+                    "variable": np.arange(10.0),
+                }
+            )
+
+            for i in range(2):
+                df["variable"] += i
+                df.to_csv(filepath, index=False)
+                os.utime(filepath, ns=(i, i))
+
+                expected = featurize.read_raw_data(filepath, "Date", True)
+
+                for _ in range(2):
+                    cached = preprocess_utils.read_csv_cached(
+                        filepath,
+                        featurize.read_raw_data,
+                        cache_dir,
+                        timestamp_column="Date",
+                        convert_timestamp_to_datetime=True,
+                    )
+
+                    pd.testing.assert_frame_equal(cached, expected)
+
+            self.assertEqual(len(os.listdir(cache_dir)), 1)
+
+    def test_featurize_parallel(self):
+        """Test that featurizing files in parallel gives the same output as
+        featurizing them one by one."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected = self.run_featurize(tmp_dir)
+
+            for chunk_size in [None, 97]:
+                output = self.run_featurize(tmp_dir, n_jobs=2, chunk_size=chunk_size)
+
+                # The scaler is fitted on chunks, in a different order of
+                # summation than the reference.
+                np.testing.assert_allclose(output[0], expected[0])
+                np.testing.assert_array_equal(output[1], expected[1])
+                pd.testing.assert_frame_equal(output[2], expected[2])
+
+                # The chunks spilled by the workers are removed
+                self.assertEqual(
+                    os.listdir(Path(tmp_dir) / featurize.DATA_FEATURIZED_PATH),
+                    [featurize.FEATURE_VECTORS_PATH.name],
+                )
+
+    def test_train_out_of_core(self):
+        """Test that out-of-core training labels all feature vectors, and
+        writes them in the same format as in-memory training."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = np.concatenate(
+            [rng.normal(loc=c, size=(500, 3)) for c in (-5, 0, 5)]
+        )
+        rng.shuffle(feature_vectors)
+
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            os.chdir(tmp_dir)
+
+            try:
+                filepaths = ["shard0.npy", "shard1.npy"]
+                np.save(filepaths[0], feature_vectors[:700])
+                np.save(filepaths[1], feature_vectors[700:])
+
+                model = MiniBatchKMeans(n_clusters=3, n_init=3, random_state=0)
+                model = train.train_out_of_core(filepaths, model, 128, 5)
+
+                with open(LABELS_PATH) as f:
+                    labels_csv = f.read()
+            finally:
+                os.chdir(cwd)
+
+        labels = model.predict(feature_vectors)
+
+        self.assertEqual(labels_csv, pd.DataFrame(labels).to_csv())
+        self.assertEqual(len(np.unique(labels)), 3)
+
+    def test_sweep_n_clusters(self):
+        """Test that the n_clusters sweep scores every candidate, and selects
+        the number of clusters in the data."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = np.concatenate(
+            [rng.normal(loc=c, size=(300, 3)) for c in (-5, 0, 5)]
+        )
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "featurized.npy")
+            np.save(filepath, feature_vectors)
+
+            labels, model, sweep = train.sweep_n_clusters(
+                filepath, "minibatchkmeans", [2, 3, 4], 100, n_jobs=2, sample_size=500
+            )
+
+        self.assertEqual(list(sweep), ["2", "3", "4"])
+        self.assertEqual(model.n_clusters, 3)
+        self.assertEqual(len(np.unique(labels)), 3)
+        self.assertIn("fit_time", sweep["3"])
+        self.assertEqual(train.get_n_clusters_candidates(7), None)
+        self.assertEqual(train.get_n_clusters_candidates("auto")[0], 2)
+
+    def test_calculate_model_metrics(self):
+        """Test the model metrics against scikit-learn, and that the sampled
+        silhouette score is within its confidence interval of the exact
+        score."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = np.concatenate(
+            [rng.normal(loc=c, size=(n, 4)) for c, n in ((-2, 400), (0, 900), (3, 100))]
+        )
+        labels = np.repeat([5, -1, 2], [400, 900, 100])
+
+        metrics = cluster.calculate_model_metrics(None, feature_vectors, labels)
+
+        self.assertAlmostEqual(
+            metrics["silhouette_score"], silhouette_score(feature_vectors, labels)
+        )
+        self.assertAlmostEqual(
+            metrics["calinski_harabasz_score"],
+            calinski_harabasz_score(feature_vectors, labels),
+            places=6,
+        )
+        self.assertAlmostEqual(
+            metrics["davies_bouldin_score"],
+            davies_bouldin_score(feature_vectors, labels),
+        )
+        self.assertEqual(metrics["silhouette_sample_size"], 1400)
+
+        sampled_metrics = cluster.calculate_model_metrics(
+            None, feature_vectors, labels, sample_size=300
+        )
+
+        self.assertLessEqual(sampled_metrics["silhouette_sample_size"], 300)
+        self.assertLess(
+            sampled_metrics["silhouette_score_ci_lower"], metrics["silhouette_score"]
+        )
+        self.assertGreater(
+            sampled_metrics["silhouette_score_ci_upper"], metrics["silhouette_score"]
+        )
+
+    def test_dbscan_predict(self):
+        """Test that DBSCAN labels the feature vectors with the first core
+        sample within eps, as when comparing them one pair at a time."""
+
+        rng = np.random.default_rng(2020)
+        model = DBSCAN(eps=0.05, min_samples=3, metric="cosine")
+        model.fit(rng.normal(size=(600, 5)))
+
+        feature_vectors = rng.normal(size=(300, 5))
+        feature_vectors[3] = 0
+
+        expected = np.full(len(feature_vectors), -1)
+
+        for i, f in enumerate(feature_vectors):
+            for j, core_sample in enumerate(model.components_):
+                # Older versions of scipy clamp the NaN distance of zero
+                # vectors to 0, newer ones return NaN.
+                with np.errstate(invalid="ignore"):
+                    distance = np.nan_to_num(cosine(f, core_sample), nan=0.0)
+
+                if distance < model.eps:
+                    expected[i] = model.labels_[model.core_sample_indices_[j]]
+                    break
+
+        cluster_model = ClusterModel.__new__(ClusterModel)
+        labels = cluster_model.dbscan_predict(model, feature_vectors, batch_size=7)
+
+        np.testing.assert_array_equal(labels, expected)
+        self.assertTrue(np.any(labels >= 0))
+        self.assertEqual(labels[3], model.labels_[model.core_sample_indices_[0]])
+
+    def test_find_nearest_cluster_centers(self):
+        """Test that the nearest cluster centers and the sum of distances are
+        the same as when computed from the full distance matrix, and that the
+        nearest cluster center is the label predicted by the model."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = rng.normal(size=(1000, 6))
+        model = MiniBatchKMeans(n_clusters=5, n_init=3, random_state=0)
+        model.fit(feature_vectors)
+
+        labels, distances, second_labels, sum_distance_to_centers = (
+            cluster.find_nearest_cluster_centers(
+                feature_vectors, model.cluster_centers_, batch_size=64
+            )
+        )
+
+        distances_to_centers, expected_sum = cluster.calculate_distances(
+            feature_vectors, model, model.cluster_centers_
+        )
+
+        np.testing.assert_array_equal(labels, model.predict(feature_vectors))
+        np.testing.assert_array_equal(
+            np.column_stack((labels, second_labels)),
+            cluster.find_closest_cluster_centers(distances_to_centers),
+        )
+        np.testing.assert_allclose(distances, distances_to_centers.min(axis=1))
+        np.testing.assert_allclose(sum_distance_to_centers, expected_sum)
+
+        # Without cluster centers, all feature vectors are labeled as noise
+        labels, distances, second_labels, sum_distance_to_centers = (
+            cluster.find_nearest_cluster_centers(feature_vectors, np.empty((0, 6)))
+        )
+
+        np.testing.assert_array_equal(labels, -1)
+        np.testing.assert_array_equal(second_labels, -1)
+        np.testing.assert_array_equal(distances, np.inf)
+        np.testing.assert_array_equal(sum_distance_to_centers, 0)
+
+    def test_generate_cluster_names(self):
+        """Test that the cluster characteristics are named after the features
+        of the feature mode, for each input column."""
+
+        cluster_centers = np.zeros((2, 24 * 2))
+        cluster_centers[0, 0] = 1
+        cluster_centers[1, 47] = 1
+
+        cluster_names = postprocess.generate_cluster_names(
+            None, cluster_centers, feature_mode="catch22"
+        )
+        characteristics = cluster_names["cluster_characteristics"]
+
+        self.assertTrue(
+            characteristics[0].startswith("highest DN_HistogramMode_5 of column 0")
+        )
+        self.assertIn("highest DN_Spread_Std of column 1", characteristics[1])
+        self.assertNotIn("median", "".join(characteristics))
+
+        cluster_names = postprocess.generate_cluster_names(None, np.eye(2, 6))
+        characteristics = cluster_names["cluster_characteristics"]
+
+        self.assertTrue(characteristics[0].startswith("highest mean, lowest median"))
+
+    def test_compute_cluster_centers(self):
+        """Test that the cluster centers are identical to averaging the core
+        samples of each cluster one cluster at a time."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = rng.normal(size=(2000, 6))
+        labels = rng.integers(-1, 5, size=2000)
+        unique_labels = np.unique(labels)
+        core_sample_indices = np.flatnonzero((labels >= 0) & (labels != 3))
+
+        cluster_centers = train.compute_cluster_centers(
+            feature_vectors, labels, unique_labels, core_sample_indices
+        )
+
+        for c, cluster_center in zip(unique_labels, cluster_centers):
+            indices = [i for i in core_sample_indices if labels[i] == c]
+
+            if indices:
+                expected = np.average(np.array(feature_vectors[indices]), axis=0)
+            else:
+                expected = np.zeros(feature_vectors.shape[-1])
+
+            np.testing.assert_array_equal(cluster_center, expected)
+
+    def test_warm_start(self):
+        """Test that warm-starting from an archived model updates the scaler
+        and the model with the new feature vectors only, and keeps the
+        identity of the labels."""
+
+        train_params = {
+            "learning_method": "minibatchkmeans",
+            "n_clusters": 3,
+            "max_iter": 100,
+            "use_predefined_centroids": False,
+            "fix_predefined_centroids": False,
+            "annotations_dir": None,
+            "batch_size": 10,
+        }
+
+        cwd = os.getcwd()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            self.run_featurize(tmp_dir, train_params=train_params)
+
+            os.chdir(tmp_dir)
+
+            try:
+                train.train("assets/data/featurized")
+                model_archive.archive_model("previous")
+                previous_model, previous_scaler, _ = (
+                    model_archive.load_archived_model("previous")
+                )
+
+                # Add a day of new data
+                rng = np.random.default_rng(2021)
+                pd.DataFrame(
+                    {
+                        "Date": pd.date_range("2022-06-03", periods=1013, freq="1s"),
+                        "variable": rng.normal(size=1013),
+                        "other": rng.normal(size=1013),
+                    }
+                ).to_csv("assets/data/raw/data/data2.csv", index=False)
+            finally:
+                os.chdir(cwd)
+
+            train_params["warm_start_from"] = "previous"
+            self.run_featurize(tmp_dir, train_params=train_params)
+
+            os.chdir(tmp_dir)
+
+            try:
+                train.train("assets/data/featurized")
+                model = joblib.load(train.MODELS_FILE_PATH)
+                scaler = joblib.load(train.INPUT_SCALER_PATH)
+            finally:
+                os.chdir(cwd)
+
+        n_new = 1013 // 20
+        self.assertEqual(scaler.n_samples_seen_, previous_scaler.n_samples_seen_ + n_new)
+        self.assertEqual(model.n_steps_, previous_model.n_steps_ + n_new // 10)
+
+        # The centers of the updated model are closest to the centers of the
+        # archived model with the same label.
+        previous_centers = scaler.transform(
+            previous_scaler.inverse_transform(previous_model.cluster_centers_)
+        )
+        np.testing.assert_array_equal(
+            model.predict(previous_centers), np.arange(3)
+        )
+
+    def test_constrained_kmeans(self):
+        """Test that constrained k-means keeps the fixed centroids, assigns
+        each feature vector to its nearest centroid, and stops early when the
+        centroids converge."""
+
+        rng = np.random.default_rng(2020)
+        blob_centers = np.array([[-5.0, 0.0], [0.0, 5.0], [5.0, 0.0]])
+        feature_vectors = np.concatenate(
+            [rng.normal(loc=c, size=(300, 2)) for c in blob_centers]
+        )
+        fixed_centroid = np.array([0.0, -10.0])
+        initial_centroids = np.array([fixed_centroid, [-1.0, 0.0], [1.0, 0.0], [0.0, 1.0]])
+
+        centroids, labels, n_iter = train.constrained_kmeans(
+            feature_vectors, initial_centroids, 1, max_iter=100
+        )
+
+        np.testing.assert_array_equal(centroids[0], fixed_centroid)
+        self.assertLess(n_iter, 100)
+
+        distances = ((feature_vectors[:, None, :] - centroids) ** 2).sum(axis=2)
+        np.testing.assert_array_equal(labels, distances.argmin(axis=1))
+
+        # The free centroids have converged to the blobs
+        nearest_blob = ((centroids[1:, None, :] - blob_centers) ** 2).sum(axis=2)
+        self.assertEqual(sorted(nearest_blob.argmin(axis=1)), [0, 1, 2])
+        self.assertLess(nearest_blob.min(axis=1).max(), 0.1)
+
+    def test_kmeans_elkan(self):
+        """Test that the Elkan k-means model has cluster centers in the same
+        format as the other models."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = np.concatenate(
+            [rng.normal(loc=c, size=(300, 3)) for c in (-5, 0, 5)]
+        )
+
+        model = train.build_model("kmeans_elkan", 3, 100)
+        labels, model = train.fit_predict(feature_vectors, model)
+
+        self.assertEqual(model.cluster_centers_.shape, (3, 3))
+        self.assertEqual(len(np.unique(labels)), 3)
+
+        distances, _ = cluster.calculate_distances(
+            feature_vectors, model, model.cluster_centers_
+        )
+        np.testing.assert_array_equal(distances.argmin(axis=1), labels)
+
+    def test_featurize_float32(self):
+        """Test that the float32 mode gives the same cluster labels as
+        float64."""
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            expected = self.run_featurize(tmp_dir)
+            output = self.run_featurize(tmp_dir, dtype="float32")
+
+        self.assertEqual(output[0].dtype, np.float32)
+        np.testing.assert_allclose(output[0], expected[0], rtol=1e-5, atol=1e-5)
+
+        labels = {}
+
+        for feature_vectors in (expected[0], output[0]):
+            model = train.build_model("kmeans_elkan", 3, 100)
+            model.set_params(random_state=0)
+            labels[feature_vectors.dtype.name], model = train.fit_predict(
+                feature_vectors, model
+            )
+
+            self.assertEqual(model.cluster_centers_.dtype, feature_vectors.dtype)
+
+        np.testing.assert_array_equal(labels["float32"], labels["float64"])
+
+    def test_model_bundle(self):
+        """Test that the model bundle is parsed once, and that scaling with
+        its parameters gives the same result as the scaler."""
+
+        rng = np.random.default_rng(2020)
+        feature_vectors = rng.normal(loc=3, scale=2, size=(100, 4))
+        scaler = StandardScaler().fit(feature_vectors)
+        cluster_centers = rng.normal(size=(3, 4))
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            filepath = os.path.join(tmp_dir, "model_bundle.npz")
+            model_bundle.save_model_bundle(
+                cluster_centers, scaler, np.arange(3), filepath=filepath
+            )
+
+            bundle = model_bundle.load_model_bundle(filepath)
+            self.assertIs(model_bundle.load_model_bundle(filepath), bundle)
+
+            # The bundle is parsed again when the file changes
+            model_bundle.save_model_bundle(
+                cluster_centers * 2, scaler, np.arange(3), filepath=filepath
+            )
+            os.utime(filepath, ns=(0, 0))
+            updated_bundle = model_bundle.load_model_bundle(filepath)
+
+        np.testing.assert_array_equal(bundle["cluster_centers"], cluster_centers)
+        np.testing.assert_array_equal(
+            updated_bundle["cluster_centers"], cluster_centers * 2
+        )
+        self.assertFalse(bundle["cluster_centers"].flags.writeable)
+
+        for dtype in (np.float64, np.float32):
+            np.testing.assert_array_equal(
+                model_bundle.scale_feature_vectors(feature_vectors.astype(dtype), bundle),
+                scaler.transform(feature_vectors.astype(dtype)),
+            )
+
 
 if __name__ == "__main__":
 